@@ -9,12 +9,52 @@ if not BOT_TOKEN:
     raise ValueError("No BOT_TOKEN found in environment variables")
 
 # ✅ Database path (Railway safe)
-DB_PATH = "data/bot.db"
+DB_PATH = os.getenv("DB_PATH", "data/bot.db")
+
+# Number of read-only SQLite connections kept open next to the single writer
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+
+# Stats counters are buffered and written in batches
+STATS_FLUSH_INTERVAL = int(os.getenv("STATS_FLUSH_INTERVAL", "30"))
+STATS_FLUSH_THRESHOLD = int(os.getenv("STATS_FLUSH_THRESHOLD", "500"))
+# Hours kept in hourly stats buckets before they are rolled up into days
+STATS_HOURLY_RETENTION = int(os.getenv("STATS_HOURLY_RETENTION", "48"))
+
+# In-process cache of per-group settings
+SETTINGS_CACHE_SIZE = int(os.getenv("SETTINGS_CACHE_SIZE", "10000"))
+SETTINGS_CACHE_TTL = int(os.getenv("SETTINGS_CACHE_TTL", "600"))
+COMMANDS_CACHE_SIZE = int(os.getenv("COMMANDS_CACHE_SIZE", "10000"))
+COMMANDS_CACHE_TTL = int(os.getenv("COMMANDS_CACHE_TTL", "3600"))
+
+# Chat member / admin list caches, kept fresh by chat_member updates
+MEMBER_CACHE_SIZE = int(os.getenv("MEMBER_CACHE_SIZE", "50000"))
+MEMBER_CACHE_TTL = int(os.getenv("MEMBER_CACHE_TTL", "300"))
+ADMIN_CACHE_SIZE = int(os.getenv("ADMIN_CACHE_SIZE", "10000"))
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", "900"))
+BOT_RIGHTS_TTL = int(os.getenv("BOT_RIGHTS_TTL", "86400"))
+
+# How updates are received: "polling" (default) or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError("BOT_MODE must be 'polling' or 'webhook'")
+
+# Webhook mode: Telegram posts to WEBHOOK_URL + WEBHOOK_PATH, which the reverse
+# proxy forwards to WEBHOOK_HOST:WEBHOOK_PORT
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    raise ValueError("WEBHOOK_URL is required when BOT_MODE=webhook")
 
 # Log channel ID (optional)
 LOG_CHANNEL_ID = os.getenv("LOG_CHANNEL_ID")
 if LOG_CHANNEL_ID:
     LOG_CHANNEL_ID = int(LOG_CHANNEL_ID)
+# Moderation log digests: entries queued at most, seconds between digests
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "1000"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "10"))
 
 # Default settings
 DEFAULT_WARN_LIMIT = 3
@@ -29,6 +69,69 @@ DEFAULT_CAPTCHA_TIMEOUT = 60
 WELCOME_MESSAGE = "Welcome {name} to {group}! Please verify yourself by clicking the button below."
 GOODBYE_MESSAGE = "Goodbye {name}!"
 
+# Flood control: more than flood_limit messages within FLOOD_WINDOW seconds
+FLOOD_WINDOW = int(os.getenv("FLOOD_WINDOW", "5"))
+FLOOD_MUTE_DURATION = int(os.getenv("FLOOD_MUTE_DURATION", "300"))
+FLOOD_MAX_TRACKED = int(os.getenv("FLOOD_MAX_TRACKED", "100000"))
+
+# Compiled word filters kept in memory (one per group)
+FILTER_CACHE_SIZE = int(os.getenv("FILTER_CACHE_SIZE", "10000"))
+FILTER_CACHE_TTL = int(os.getenv("FILTER_CACHE_TTL", "3600"))
+
+# Job scheduler: jobs due within SCHEDULER_HORIZON seconds are held in memory
+SCHEDULER_HORIZON = int(os.getenv("SCHEDULER_HORIZON", "3600"))
+SCHEDULER_BATCH = int(os.getenv("SCHEDULER_BATCH", "100"))
+
+# Worker processes; above 1 a supervisor shards updates between them by chat id
+WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER_STOP_TIMEOUT = int(os.getenv("WORKER_STOP_TIMEOUT", "30"))
+
+# Prometheus metrics at http://METRICS_HOST:METRICS_PORT/metrics, 0 disables them.
+# Supervisor workers listen on METRICS_PORT + their index.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Update capture for tools/replay.py: set RECORD_UPDATES_DIR to enable it. Files
+# rotate after RECORD_MAX_MB and only the newest RECORD_KEEP are kept.
+RECORD_UPDATES_DIR = os.getenv("RECORD_UPDATES_DIR", "")
+RECORD_MAX_MB = int(os.getenv("RECORD_MAX_MB", "64"))
+RECORD_KEEP = int(os.getenv("RECORD_KEEP", "10"))
+
+# FSM storage: "sqlite" (default), "redis" (needs the redis package and
+# REDIS_URL) or "memory". Unfinished prompts expire after FSM_TTL seconds.
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").lower()
+if FSM_STORAGE not in ("sqlite", "redis", "memory"):
+    raise ValueError("FSM_STORAGE must be 'sqlite', 'redis' or 'memory'")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+FSM_TTL = int(os.getenv("FSM_TTL", "600"))
+FSM_PURGE_INTERVAL = int(os.getenv("FSM_PURGE_INTERVAL", "300"))
+# SQLite FSM entries cached per supervisor worker (WORKERS > 1 only)
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+
+# Captcha sweeper: expired users kicked per batch
+CAPTCHA_SWEEP_BATCH = int(os.getenv("CAPTCHA_SWEEP_BATCH", "50"))
+
+# /purge: deleteMessages chunks, run PURGE_CONCURRENCY at a time
+PURGE_CHUNK_SIZE = 100
+PURGE_CONCURRENCY = int(os.getenv("PURGE_CONCURRENCY", "3"))
+
+# Outbound Bot API limits (calls per second)
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", "30"))
+OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60)))
+OUTBOUND_PRIVATE_RATE = float(os.getenv("OUTBOUND_PRIVATE_RATE", "1"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+
+# /report: DMs sent at once, and how long an admin who blocked the bot is skipped
+REPORT_CONCURRENCY = int(os.getenv("REPORT_CONCURRENCY", "10"))
+REPORT_RETRY_AFTER = int(os.getenv("REPORT_RETRY_AFTER", "86400"))
+
+# Join raids: more than JOIN_BURST_THRESHOLD joins within JOIN_BURST_WINDOW seconds
+# switch a chat to one batched welcome/captcha message per JOIN_BATCH_DELAY seconds
+JOIN_BURST_THRESHOLD = int(os.getenv("JOIN_BURST_THRESHOLD", "5"))
+JOIN_BURST_WINDOW = int(os.getenv("JOIN_BURST_WINDOW", "10"))
+JOIN_BATCH_DELAY = float(os.getenv("JOIN_BATCH_DELAY", "5"))
+JOIN_BATCH_MAX = int(os.getenv("JOIN_BATCH_MAX", "200"))
+
 TIME_UNITS = {
     "m": 60,
     "h": 3600,
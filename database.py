@@ -1,15 +1,122 @@
 import os
+import asyncio
+import inspect
+import logging
+import time
 import aiosqlite
 import json
-from config import DB_PATH
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, NamedTuple
+from config import (
+    DB_PATH, DB_READERS, STATS_FLUSH_INTERVAL, STATS_FLUSH_THRESHOLD, STATS_HOURLY_RETENTION,
+    SETTINGS_CACHE_SIZE, SETTINGS_CACHE_TTL, COMMANDS_CACHE_SIZE, COMMANDS_CACHE_TTL,
+    DEFAULT_WARN_LIMIT, DEFAULT_FLOOD_LIMIT, DEFAULT_ANTI_SPAM, DEFAULT_WELCOME,
+    DEFAULT_GOODBYE, DEFAULT_FILTER, DEFAULT_VERIFICATION,
+)
+from utils.cache import TTLCache
+from utils.metrics import DB_DURATION, timed
 
 # Ensure the data directory exists
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+# --- Connection pool ---
+# One long-lived writer (SQLite allows a single writer at a time anyway) and a
+# small set of read-only connections. WAL lets readers run alongside the writer.
+_writer = None
+_write_lock = asyncio.Lock()
+_readers = None
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA busy_timeout = 5000",
+)
+
+async def _connect(readonly: bool = False):
+    db = await aiosqlite.connect(DB_PATH)
+    for pragma in PRAGMAS:
+        await db.execute(pragma)
+    if readonly:
+        await db.execute("PRAGMA query_only = ON")
+    return db
+
+@asynccontextmanager
+async def _read():
+    if _readers is None:
+        raise RuntimeError("Database is not initialised, call init_db() first")
+    db = await _readers.get()
+    try:
+        yield db
+    finally:
+        _readers.put_nowait(db)
+
+@asynccontextmanager
+async def _write():
+    if _writer is None:
+        raise RuntimeError("Database is not initialised, call init_db() first")
+    async with _write_lock:
+        try:
+            yield _writer
+        except BaseException:
+            await _writer.rollback()
+            raise
+        await _writer.commit()
+
+async def open_pool():
+    global _writer, _readers
+    if _writer is not None:
+        return
+    _writer = await _connect()
+    _readers = asyncio.Queue()
+    for _ in range(max(1, DB_READERS)):
+        _readers.put_nowait(await _connect(readonly=True))
+
+async def close_db():
+    global _writer, _readers, _stats_task
+    if _writer is None:
+        return
+    if _stats_task is not None:
+        _stats_task.cancel()
+        _stats_task = None
+    await flush_stats()
+    async with _write_lock:
+        while not _readers.empty():
+            await _readers.get_nowait().close()
+        await _writer.close()
+        _writer = None
+        _readers = None
+
+# --- Schema migrations ---
+# Each entry upgrades the schema by one version; PRAGMA user_version records how
+# many have been applied. Append new migrations, never edit applied ones.
+_WARNING_COUNT_TRIGGERS = (
+    '''
+        CREATE TRIGGER IF NOT EXISTS warnings_count_insert AFTER INSERT ON warnings
+        BEGIN
+            INSERT INTO warning_counts (group_id, user_id, count) VALUES (NEW.group_id, NEW.user_id, 1)
+            ON CONFLICT(group_id, user_id) DO UPDATE SET count = count + 1;
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS warnings_count_delete AFTER DELETE ON warnings
+        BEGIN
+            UPDATE warning_counts SET count = count - 1
+            WHERE group_id = OLD.group_id AND user_id = OLD.user_id;
+            DELETE FROM warning_counts
+            WHERE group_id = OLD.group_id AND user_id = OLD.user_id AND count <= 0;
+        END
+    ''',
+)
+
+MIGRATIONS = (
+    # 1: initial schema
+    (
         # Groups table
-        await db.execute('''
+        '''
             CREATE TABLE IF NOT EXISTS groups (
                 group_id INTEGER PRIMARY KEY,
                 settings TEXT DEFAULT '{}',
@@ -22,9 +129,9 @@ async def init_db():
                 filter_enabled INTEGER DEFAULT 1,
                 verification_enabled INTEGER DEFAULT 0
             )
-        ''')
+        ''',
         # Warnings table
-        await db.execute('''
+        '''
             CREATE TABLE IF NOT EXISTS warnings (
                 group_id INTEGER,
                 user_id INTEGER,
@@ -33,9 +140,9 @@ async def init_db():
                 timestamp INTEGER,
                 PRIMARY KEY (group_id, user_id, timestamp)
             )
-        ''')
+        ''',
         # Bans table (for stats)
-        await db.execute('''
+        '''
             CREATE TABLE IF NOT EXISTS bans (
                 group_id INTEGER,
                 user_id INTEGER,
@@ -44,205 +151,676 @@ async def init_db():
                 timestamp INTEGER,
                 duration INTEGER DEFAULT 0
             )
-        ''')
+        ''',
         # Mutes table
-        await db.execute('''
+        '''
             CREATE TABLE IF NOT EXISTS mutes (
                 group_id INTEGER,
                 user_id INTEGER,
                 until INTEGER,
                 PRIMARY KEY (group_id, user_id)
             )
-        ''')
+        ''',
         # Custom commands table
-        await db.execute('''
+        '''
             CREATE TABLE IF NOT EXISTS custom_commands (
                 group_id INTEGER,
                 command TEXT,
                 response TEXT,
                 PRIMARY KEY (group_id, command)
             )
-        ''')
+        ''',
         # Verified users table
-        await db.execute('''
+        '''
             CREATE TABLE IF NOT EXISTS verified (
                 group_id INTEGER,
                 user_id INTEGER,
                 verified_at INTEGER,
                 PRIMARY KEY (group_id, user_id)
             )
-        ''')
+        ''',
+        # Captchas waiting for the user to press Verify
+        '''
+            CREATE TABLE IF NOT EXISTS pending_verifications (
+                group_id INTEGER,
+                user_id INTEGER,
+                deadline INTEGER,
+                message_id INTEGER,
+                PRIMARY KEY (group_id, user_id)
+            )
+        ''',
         # Stats table
-        await db.execute('''
+        '''
             CREATE TABLE IF NOT EXISTS stats (
                 group_id INTEGER,
                 key TEXT,
                 value INTEGER DEFAULT 0,
                 PRIMARY KEY (group_id, key)
             )
-        ''')
-        await db.commit()
+        ''',
+        # FSM state and data, expired rows are ignored and purged periodically
+        '''
+            CREATE TABLE IF NOT EXISTS fsm (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT DEFAULT '{}',
+                expires_at INTEGER
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_fsm_expires_at ON fsm (expires_at)',
+        # Blocked words / regexes table
+        '''
+            CREATE TABLE IF NOT EXISTS filters (
+                group_id INTEGER,
+                pattern TEXT,
+                is_regex INTEGER DEFAULT 0,
+                PRIMARY KEY (group_id, pattern)
+            )
+        ''',
+        # Admins the bot could not DM a report to (blocked the bot, never started it)
+        '''
+            CREATE TABLE IF NOT EXISTS report_failures (
+                user_id INTEGER PRIMARY KEY,
+                failed_at INTEGER
+            )
+        ''',
+        # Scheduled jobs table (timed unbans and unmutes)
+        '''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_at INTEGER,
+                kind TEXT,
+                group_id INTEGER,
+                user_id INTEGER,
+                payload TEXT
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_jobs_run_at ON jobs (run_at)',
+        'CREATE INDEX IF NOT EXISTS idx_jobs_target ON jobs (kind, group_id, user_id)',
+    ),
+    # 2: indexes for per-user lookups and expiry scans, materialized warning counts
+    (
+        'CREATE INDEX IF NOT EXISTS idx_bans_group_user_time ON bans (group_id, user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_mutes_until ON mutes (until)',
+        '''
+            CREATE TABLE IF NOT EXISTS warning_counts (
+                group_id INTEGER,
+                user_id INTEGER,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (group_id, user_id)
+            ) WITHOUT ROWID
+        ''',
+        *_WARNING_COUNT_TRIGGERS,
+        '''
+            INSERT OR REPLACE INTO warning_counts (group_id, user_id, count)
+            SELECT group_id, user_id, COUNT(*) FROM warnings GROUP BY group_id, user_id
+        ''',
+    ),
+    # 3: rowid key for warnings, the timestamp key rejected two warns within a second
+    (
+        '''
+            CREATE TABLE warnings_new (
+                id INTEGER PRIMARY KEY,
+                group_id INTEGER,
+                user_id INTEGER,
+                admin_id INTEGER,
+                reason TEXT,
+                timestamp INTEGER
+            )
+        ''',
+        '''
+            INSERT INTO warnings_new (group_id, user_id, admin_id, reason, timestamp)
+            SELECT group_id, user_id, admin_id, reason, timestamp FROM warnings ORDER BY timestamp
+        ''',
+        # Also drops the counting triggers, the counts themselves stay valid
+        'DROP TABLE warnings',
+        'ALTER TABLE warnings_new RENAME TO warnings',
+        'CREATE INDEX idx_warnings_target ON warnings (group_id, user_id, timestamp)',
+        *_WARNING_COUNT_TRIGGERS,
+    ),
+    # 4: counters per hour, rolled up into days once older than STATS_HOURLY_RETENTION
+    (
+        '''
+            CREATE TABLE stats_hourly (
+                group_id INTEGER,
+                hour INTEGER,
+                key TEXT,
+                value INTEGER NOT NULL,
+                PRIMARY KEY (group_id, hour, key)
+            ) WITHOUT ROWID
+        ''',
+        '''
+            CREATE TABLE stats_daily (
+                group_id INTEGER,
+                day INTEGER,
+                key TEXT,
+                value INTEGER NOT NULL,
+                PRIMARY KEY (group_id, day, key)
+            ) WITHOUT ROWID
+        ''',
+    ),
+)
+
+async def migrate():
+    async with _write() as db:
+        # Taking the write lock first keeps concurrent processes from both migrating
+        await db.execute('BEGIN IMMEDIATE')
+        cursor = await db.execute('PRAGMA user_version')
+        version = (await cursor.fetchone())[0]
+        for number, statements in enumerate(MIGRATIONS[version:], version + 1):
+            for statement in statements:
+                await db.execute(statement)
+            await db.execute(f'PRAGMA user_version = {number}')
+            logging.info("Database migrated to version %s", number)
+
+async def init_db():
+    global _stats_task
+    await open_pool()
+    if _stats_task is None:
+        _stats_task = asyncio.create_task(_stats_flusher())
+    await migrate()
 
 # --- Group settings ---
-async def get_group_settings(group_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute('''
-            SELECT settings, warn_limit, flood_limit, rules, welcome_enabled,
-                   goodbye_enabled, anti_spam_enabled, filter_enabled, verification_enabled
-            FROM groups WHERE group_id = ?
-        ''', (group_id,))
+@dataclass(frozen=True)
+class GroupSettings:
+    settings: dict = field(default_factory=dict)
+    warn_limit: int = DEFAULT_WARN_LIMIT
+    flood_limit: int = DEFAULT_FLOOD_LIMIT
+    rules: str = ""
+    welcome_enabled: bool = DEFAULT_WELCOME
+    goodbye_enabled: bool = DEFAULT_GOODBYE
+    anti_spam_enabled: bool = DEFAULT_ANTI_SPAM
+    filter_enabled: bool = DEFAULT_FILTER
+    verification_enabled: bool = DEFAULT_VERIFICATION
+
+SETTING_COLUMNS = tuple(f.name for f in fields(GroupSettings))
+_BOOL_SETTINGS = {f.name for f in fields(GroupSettings) if f.type is bool}
+
+# Settings are read on every join, leave, warn and panel open; writers go
+# through update_group_setting() which keeps this cache in sync.
+_settings_cache = TTLCache(SETTINGS_CACHE_SIZE, SETTINGS_CACHE_TTL)
+
+def _settings_from_row(row):
+    values = dict(zip(SETTING_COLUMNS, row))
+    values["settings"] = json.loads(values["settings"] or "{}")
+    for key in _BOOL_SETTINGS:
+        values[key] = bool(values[key])
+    return GroupSettings(**values)
+
+def peek_group_settings(group_id: int):
+    # Cached settings or None, never touches the database
+    return _settings_cache.get(group_id)
+
+async def get_group_settings(group_id: int) -> GroupSettings:
+    settings = _settings_cache.get(group_id)
+    if settings is not None:
+        return settings
+    async with _read() as db:
+        cursor = await db.execute(
+            f'SELECT {", ".join(SETTING_COLUMNS)} FROM groups WHERE group_id = ?', (group_id,)
+        )
         row = await cursor.fetchone()
-        if row:
-            return {
-                "settings": json.loads(row[0]),
-                "warn_limit": row[1],
-                "flood_limit": row[2],
-                "rules": row[3],
-                "welcome_enabled": bool(row[4]),
-                "goodbye_enabled": bool(row[5]),
-                "anti_spam_enabled": bool(row[6]),
-                "filter_enabled": bool(row[7]),
-                "verification_enabled": bool(row[8]),
-            }
-        else:
-            # Insert default settings
-            default_settings = json.dumps({})
+    if row:
+        settings = _settings_from_row(row)
+    else:
+        # Insert default settings
+        async with _write() as db:
             await db.execute('''
-                INSERT INTO groups (group_id, settings) VALUES (?, ?)
-            ''', (group_id, default_settings))
-            await db.commit()
-            return {
-                "settings": {},
-                "warn_limit": 3,
-                "flood_limit": 5,
-                "rules": "",
-                "welcome_enabled": True,
-                "goodbye_enabled": True,
-                "anti_spam_enabled": True,
-                "filter_enabled": True,
-                "verification_enabled": False,
-            }
-
-async def update_group_setting(group_id: int, key: str, value):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(f'UPDATE groups SET {key} = ? WHERE group_id = ?', (value, group_id))
-        await db.commit()
+                INSERT OR IGNORE INTO groups (group_id, settings) VALUES (?, ?)
+            ''', (group_id, json.dumps({})))
+        settings = GroupSettings()
+    _settings_cache.set(group_id, settings)
+    return settings
+
+async def update_group_setting(group_id: int, key: str, value) -> GroupSettings:
+    if key not in SETTING_COLUMNS:
+        raise ValueError(f"Unknown group setting: {key}")
+    stored = json.dumps(value) if key == "settings" else value
+    async with _write() as db:
+        await db.execute('INSERT OR IGNORE INTO groups (group_id, settings) VALUES (?, ?)', (group_id, json.dumps({})))
+        await db.execute(f'UPDATE groups SET {key} = ? WHERE group_id = ?', (stored, group_id))
+    current = _settings_cache.get(group_id)
+    if current is None:
+        _settings_cache.pop(group_id)
+        return await get_group_settings(group_id)
+    settings = replace(current, **{key: bool(value) if key in _BOOL_SETTINGS else value})
+    _settings_cache.set(group_id, settings)
+    return settings
 
 # --- Warnings ---
 async def add_warning(group_id: int, user_id: int, admin_id: int, reason: str, timestamp: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _write() as db:
         await db.execute('''
             INSERT INTO warnings (group_id, user_id, admin_id, reason, timestamp)
             VALUES (?, ?, ?, ?, ?)
         ''', (group_id, user_id, admin_id, reason, timestamp))
-        await db.commit()
+
+class WarnResult(NamedTuple):
+    count: int
+    limit: int
+    escalated: bool
+
+async def warn_user(group_id: int, user_id: int, admin_id: int, reason: str, timestamp: int) -> WarnResult:
+    """Record a warning and, once the group's limit is reached, a permanent mute.
+
+    Runs as one transaction: on escalation the mute is stored and the warnings
+    are reset before any concurrent warn can see the new count. The returned
+    count is the one before the reset.
+    """
+    async with _write() as db:
+        await db.execute('''
+            INSERT INTO warnings (group_id, user_id, admin_id, reason, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (group_id, user_id, admin_id, reason, timestamp))
+        cursor = await db.execute('''
+            SELECT w.count, g.warn_limit FROM warning_counts w
+            LEFT JOIN groups g ON g.group_id = w.group_id
+            WHERE w.group_id = ? AND w.user_id = ?
+        ''', (group_id, user_id))
+        count, limit = await cursor.fetchone()
+        if limit is None:
+            limit = DEFAULT_WARN_LIMIT
+        escalated = count >= limit
+        if escalated:
+            await db.execute('''
+                INSERT OR REPLACE INTO mutes (group_id, user_id, until) VALUES (?, ?, 0)
+            ''', (group_id, user_id))
+            await _delete_target_jobs(db, "unmute", group_id, user_id)
+            await db.execute('DELETE FROM warnings WHERE group_id = ? AND user_id = ?', (group_id, user_id))
+    await increment_stat(group_id, "total_warnings")
+    return WarnResult(count, limit, escalated)
 
 async def get_warnings_count(group_id: int, user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    # Kept up to date by triggers on the warnings table
+    async with _read() as db:
         cursor = await db.execute('''
-            SELECT COUNT(*) FROM warnings WHERE group_id = ? AND user_id = ?
+            SELECT count FROM warning_counts WHERE group_id = ? AND user_id = ?
         ''', (group_id, user_id))
         row = await cursor.fetchone()
         return row[0] if row else 0
 
 async def reset_warnings(group_id: int, user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _write() as db:
         await db.execute('DELETE FROM warnings WHERE group_id = ? AND user_id = ?', (group_id, user_id))
-        await db.commit()
 
 # --- Mutes ---
+# Timed mutes get an 'unmute' job so the row is cleared when the mute expires
 async def add_mute(group_id: int, user_id: int, until: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    job = None
+    async with _write() as db:
         await db.execute('''
             INSERT OR REPLACE INTO mutes (group_id, user_id, until)
             VALUES (?, ?, ?)
         ''', (group_id, user_id, until))
-        await db.commit()
+        await _delete_target_jobs(db, "unmute", group_id, user_id)
+        if until:
+            job = await _insert_job(db, until, "unmute", group_id, user_id)
+    if job:
+        _notify_job(job)
 
 async def remove_mute(group_id: int, user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _write() as db:
         await db.execute('DELETE FROM mutes WHERE group_id = ? AND user_id = ?', (group_id, user_id))
-        await db.commit()
+        await _delete_target_jobs(db, "unmute", group_id, user_id)
 
 async def get_mute_until(group_id: int, user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _read() as db:
         cursor = await db.execute('SELECT until FROM mutes WHERE group_id = ? AND user_id = ?', (group_id, user_id))
         row = await cursor.fetchone()
         return row[0] if row else None
 
+# --- Scheduled jobs ---
+class Job(NamedTuple):
+    run_at: int
+    id: int
+    kind: str
+    group_id: int
+    user_id: int
+    payload: Any = None
+
+# Callables told about every job added, so the scheduler can queue it
+_job_listeners = []
+
+def on_job_added(listener):
+    _job_listeners.append(listener)
+
+def _notify_job(job: Job):
+    for listener in _job_listeners:
+        listener(job)
+
+def _job_from_row(row):
+    return Job(row[0], row[1], row[2], row[3], row[4], json.loads(row[5]) if row[5] is not None else None)
+
+async def _insert_job(db, run_at: int, kind: str, group_id: int, user_id: int, payload=None):
+    cursor = await db.execute('''
+        INSERT INTO jobs (run_at, kind, group_id, user_id, payload)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (run_at, kind, group_id, user_id, json.dumps(payload) if payload is not None else None))
+    return Job(run_at, cursor.lastrowid, kind, group_id, user_id, payload)
+
+async def _delete_target_jobs(db, kind: str, group_id: int, user_id: int):
+    await db.execute('DELETE FROM jobs WHERE kind = ? AND group_id = ? AND user_id = ?', (kind, group_id, user_id))
+
+async def add_job(run_at: int, kind: str, group_id: int, user_id: int, payload=None) -> Job:
+    async with _write() as db:
+        job = await _insert_job(db, run_at, kind, group_id, user_id, payload)
+    _notify_job(job)
+    return job
+
+async def get_jobs(after: int, until: int):
+    async with _read() as db:
+        cursor = await db.execute('''
+            SELECT run_at, id, kind, group_id, user_id, payload FROM jobs
+            WHERE run_at > ? AND run_at <= ? ORDER BY run_at
+        ''', (after, until))
+        rows = await cursor.fetchall()
+    return [_job_from_row(row) for row in rows]
+
+async def claim_jobs(job_ids):
+    # Deleting is the claim: a job removed or already run elsewhere is skipped
+    claimed = set()
+    async with _write() as db:
+        for job_id in job_ids:
+            cursor = await db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+            if cursor.rowcount:
+                claimed.add(job_id)
+    return claimed
+
+async def recover_mute_jobs():
+    # Timed mutes written before the job table existed
+    async with _write() as db:
+        await db.execute('''
+            INSERT INTO jobs (run_at, kind, group_id, user_id)
+            SELECT until, 'unmute', group_id, user_id FROM mutes m
+            WHERE until > 0 AND NOT EXISTS (
+                SELECT 1 FROM jobs j
+                WHERE j.kind = 'unmute' AND j.group_id = m.group_id AND j.user_id = m.user_id
+            )
+        ''')
+
 # --- Bans (stats) ---
 async def add_ban(group_id: int, user_id: int, admin_id: int, reason: str, timestamp: int, duration: int = 0):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _write() as db:
         await db.execute('''
             INSERT INTO bans (group_id, user_id, admin_id, reason, timestamp, duration)
             VALUES (?, ?, ?, ?, ?, ?)
         ''', (group_id, user_id, admin_id, reason, timestamp, duration))
-        # Increment stats
-        await db.execute('''
-            INSERT INTO stats (group_id, key, value)
-            VALUES (?, 'total_bans', 1)
-            ON CONFLICT(group_id, key) DO UPDATE SET value = value + 1
-        ''', (group_id,))
-        await db.commit()
+    await increment_stat(group_id, "total_bans")
 
 # --- Custom commands ---
+# group_id -> {command: response}. Each entry holds the group's full command
+# set, so a miss in it means the command does not exist.
+_commands_cache = TTLCache(COMMANDS_CACHE_SIZE, COMMANDS_CACHE_TTL)
+
+async def _group_commands(group_id: int):
+    commands = _commands_cache.get(group_id)
+    if commands is None:
+        async with _read() as db:
+            cursor = await db.execute('SELECT command, response FROM custom_commands WHERE group_id = ?', (group_id,))
+            commands = dict(await cursor.fetchall())
+        _commands_cache.set(group_id, commands)
+    return commands
+
 async def add_command(group_id: int, command: str, response: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _write() as db:
         await db.execute('''
             INSERT OR REPLACE INTO custom_commands (group_id, command, response)
             VALUES (?, ?, ?)
         ''', (group_id, command, response))
-        await db.commit()
+    commands = _commands_cache.get(group_id)
+    if commands is not None:
+        commands[command] = response
 
 async def remove_command(group_id: int, command: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _write() as db:
         await db.execute('DELETE FROM custom_commands WHERE group_id = ? AND command = ?', (group_id, command))
-        await db.commit()
+    commands = _commands_cache.get(group_id)
+    if commands is not None:
+        commands.pop(command, None)
 
 async def get_command(group_id: int, command: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute('SELECT response FROM custom_commands WHERE group_id = ? AND command = ?', (group_id, command))
-        row = await cursor.fetchone()
-        return row[0] if row else None
+    return (await _group_commands(group_id)).get(command)
 
 async def list_commands(group_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute('SELECT command FROM custom_commands WHERE group_id = ?', (group_id,))
+    return list(await _group_commands(group_id))
+
+# --- Word filters ---
+async def add_filter(group_id: int, pattern: str, is_regex: bool = False):
+    async with _write() as db:
+        await db.execute('''
+            INSERT OR REPLACE INTO filters (group_id, pattern, is_regex)
+            VALUES (?, ?, ?)
+        ''', (group_id, pattern, int(is_regex)))
+
+async def remove_filter(group_id: int, pattern: str):
+    async with _write() as db:
+        cursor = await db.execute('DELETE FROM filters WHERE group_id = ? AND pattern = ?', (group_id, pattern))
+        return cursor.rowcount > 0
+
+async def list_filters(group_id: int):
+    async with _read() as db:
+        cursor = await db.execute('SELECT pattern, is_regex FROM filters WHERE group_id = ? ORDER BY pattern', (group_id,))
         rows = await cursor.fetchall()
-        return [row[0] for row in rows]
+        return [(row[0], bool(row[1])) for row in rows]
+
+# --- Report delivery ---
+async def get_unreachable_admins(user_ids, since: int):
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+    async with _read() as db:
+        cursor = await db.execute(
+            f'SELECT user_id FROM report_failures WHERE failed_at >= ? AND user_id IN ({", ".join("?" * len(user_ids))})',
+            (since, *user_ids),
+        )
+        return {row[0] for row in await cursor.fetchall()}
+
+async def record_report_results(delivered, failed, timestamp: int):
+    if not delivered and not failed:
+        return
+    async with _write() as db:
+        await db.executemany('DELETE FROM report_failures WHERE user_id = ?', [(user_id,) for user_id in delivered])
+        await db.executemany('''
+            INSERT OR REPLACE INTO report_failures (user_id, failed_at) VALUES (?, ?)
+        ''', [(user_id, timestamp) for user_id in failed])
 
 # --- Verified users ---
 async def add_verified(group_id: int, user_id: int, timestamp: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _write() as db:
         await db.execute('''
             INSERT OR REPLACE INTO verified (group_id, user_id, verified_at)
             VALUES (?, ?, ?)
         ''', (group_id, user_id, timestamp))
-        await db.commit()
+
+async def add_pending_verifications(group_id: int, user_ids, deadline: int, message_id: int = None):
+    async with _write() as db:
+        await db.executemany('''
+            INSERT OR REPLACE INTO pending_verifications (group_id, user_id, deadline, message_id)
+            VALUES (?, ?, ?, ?)
+        ''', [(group_id, user_id, deadline, message_id) for user_id in user_ids])
+
+async def complete_verification(group_id: int, user_id: int, timestamp: int):
+    async with _write() as db:
+        await db.execute('DELETE FROM pending_verifications WHERE group_id = ? AND user_id = ?', (group_id, user_id))
+        await db.execute('''
+            INSERT OR REPLACE INTO verified (group_id, user_id, verified_at)
+            VALUES (?, ?, ?)
+        ''', (group_id, user_id, timestamp))
+
+async def remove_pending_verifications(pairs):
+    async with _write() as db:
+        await db.executemany('DELETE FROM pending_verifications WHERE group_id = ? AND user_id = ?', list(pairs))
+
+async def load_pending_verifications():
+    async with _read() as db:
+        cursor = await db.execute('SELECT deadline, group_id, user_id, message_id FROM pending_verifications')
+        return await cursor.fetchall()
 
 async def is_verified(group_id: int, user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _read() as db:
         cursor = await db.execute('SELECT 1 FROM verified WHERE group_id = ? AND user_id = ?', (group_id, user_id))
         return await cursor.fetchone() is not None
 
+# --- FSM storage ---
+# Values of an expired row are treated as unset, also when the row is updated.
+async def get_fsm(key: str, now: int):
+    async with _read() as db:
+        cursor = await db.execute('SELECT state, data, expires_at FROM fsm WHERE key = ? AND expires_at > ?', (key, now))
+        return await cursor.fetchone()
+
+async def set_fsm_state(key: str, state, now: int, expires_at: int):
+    async with _write() as db:
+        await db.execute('''
+            INSERT INTO fsm (key, state, data, expires_at) VALUES (?, ?, '{}', ?)
+            ON CONFLICT(key) DO UPDATE SET
+                state = excluded.state,
+                data = CASE WHEN fsm.expires_at > ? THEN fsm.data ELSE '{}' END,
+                expires_at = excluded.expires_at
+        ''', (key, state, expires_at, now))
+        await db.execute("DELETE FROM fsm WHERE key = ? AND state IS NULL AND data = '{}'", (key,))
+
+async def set_fsm_data(key: str, data: str, now: int, expires_at: int):
+    async with _write() as db:
+        await db.execute('''
+            INSERT INTO fsm (key, state, data, expires_at) VALUES (?, NULL, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                state = CASE WHEN fsm.expires_at > ? THEN fsm.state END,
+                data = excluded.data,
+                expires_at = excluded.expires_at
+        ''', (key, data, expires_at, now))
+        await db.execute("DELETE FROM fsm WHERE key = ? AND state IS NULL AND data = '{}'", (key,))
+
+async def purge_expired_fsm(now: int):
+    async with _write() as db:
+        await db.execute('DELETE FROM fsm WHERE expires_at <= ?', (now,))
+
 # --- Stats ---
+# Counters are buffered in memory per (group, key, hour) and written in one
+# batch, either every STATS_FLUSH_INTERVAL seconds or once STATS_FLUSH_THRESHOLD
+# keys are pending. Each flush adds to the all-time totals in stats and to the
+# hour's bucket in stats_hourly; hours older than STATS_HOURLY_RETENTION are
+# rolled up into stats_daily once per hour.
+_pending_stats = {}
+_flushing_stats = {}
+_stats_flush_lock = asyncio.Lock()
+_stats_task = None
+_threshold_flush = None
+_rolled_up_hour = 0
+
 async def increment_stat(group_id: int, key: str, inc: int = 1):
-    async with aiosqlite.connect(DB_PATH) as db:
+    stat = (group_id, key, int(time.time()) // 3600)
+    _pending_stats[stat] = _pending_stats.get(stat, 0) + inc
+    global _threshold_flush
+    if len(_pending_stats) >= STATS_FLUSH_THRESHOLD and (_threshold_flush is None or _threshold_flush.done()):
+        _threshold_flush = asyncio.create_task(flush_stats())
+        _threshold_flush.add_done_callback(_log_flush_error)
+
+def _log_flush_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logging.error("Failed to flush stats", exc_info=task.exception())
+
+async def flush_stats():
+    global _pending_stats, _flushing_stats
+    async with _stats_flush_lock:
+        if not _pending_stats:
+            return
+        _flushing_stats, _pending_stats = _pending_stats, {}
+        totals = {}
+        for (group_id, key, hour), value in _flushing_stats.items():
+            totals[group_id, key] = totals.get((group_id, key), 0) + value
+        try:
+            async with _write() as db:
+                await db.executemany('''
+                    INSERT INTO stats (group_id, key, value)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(group_id, key) DO UPDATE SET value = value + excluded.value
+                ''', [(group_id, key, value) for (group_id, key), value in totals.items()])
+                await db.executemany('''
+                    INSERT INTO stats_hourly (group_id, hour, key, value)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(group_id, hour, key) DO UPDATE SET value = value + excluded.value
+                ''', [(group_id, hour, key, value) for (group_id, key, hour), value in _flushing_stats.items()])
+        except BaseException:
+            # Keep the deltas so the next flush retries them
+            for stat, value in _flushing_stats.items():
+                _pending_stats[stat] = _pending_stats.get(stat, 0) + value
+            raise
+        finally:
+            _flushing_stats = {}
+
+async def rollup_stats(now: int = None):
+    """Move whole days of hourly buckets older than the retention into daily ones."""
+    now = int(time.time()) if now is None else now
+    cutoff = (now // 3600 - STATS_HOURLY_RETENTION) // 24 * 24
+    async with _write() as db:
         await db.execute('''
-            INSERT INTO stats (group_id, key, value)
-            VALUES (?, ?, ?)
-            ON CONFLICT(group_id, key) DO UPDATE SET value = value + ?
-        ''', (group_id, key, inc, inc))
-        await db.commit()
+            INSERT INTO stats_daily (group_id, day, key, value)
+            SELECT group_id, hour / 24, key, SUM(value) FROM stats_hourly
+            WHERE hour < ? GROUP BY group_id, hour / 24, key
+            ON CONFLICT(group_id, day, key) DO UPDATE SET value = value + excluded.value
+        ''', (cutoff,))
+        await db.execute('DELETE FROM stats_hourly WHERE hour < ?', (cutoff,))
+
+async def _stats_flusher():
+    global _rolled_up_hour
+    while True:
+        await asyncio.sleep(STATS_FLUSH_INTERVAL)
+        try:
+            await flush_stats()
+            hour = int(time.time()) // 3600
+            if hour != _rolled_up_hour:
+                await rollup_stats()
+                _rolled_up_hour = hour
+        except Exception:
+            logging.exception("Failed to flush stats")
+
+def _pending_group_stats(group_id: int, since_hour: int = 0):
+    stats = {}
+    for buffer in (_pending_stats, _flushing_stats):
+        for (stat_group, key, hour), value in list(buffer.items()):
+            if stat_group == group_id and hour >= since_hour:
+                stats[key] = stats.get(key, 0) + value
+    return stats
 
 async def get_stat(group_id: int, key: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _read() as db:
         cursor = await db.execute('SELECT value FROM stats WHERE group_id = ? AND key = ?', (group_id, key))
         row = await cursor.fetchone()
-        return row[0] if row else 0
+    return (row[0] if row else 0) + _pending_group_stats(group_id).get(key, 0)
 
 async def get_all_stats(group_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _read() as db:
         cursor = await db.execute('SELECT key, value FROM stats WHERE group_id = ?', (group_id,))
         rows = await cursor.fetchall()
-        return dict(rows)
+    stats = dict(rows)
+    for key, value in _pending_group_stats(group_id).items():
+        stats[key] = stats.get(key, 0) + value
+    return stats
+
+async def get_stats_since(group_id: int, since: int):
+    """Counters from the hour containing ``since`` on.
+
+    Recent hours come from stats_hourly; older ones were rolled up and are
+    counted by whole days, so ranges reaching past the hourly retention start
+    at midnight UTC of the day containing ``since``.
+    """
+    since_hour = since // 3600
+    async with _read() as db:
+        cursor = await db.execute('''
+            SELECT key, SUM(value) FROM (
+                SELECT key, value FROM stats_hourly WHERE group_id = ? AND hour >= ?
+                UNION ALL
+                SELECT key, value FROM stats_daily WHERE group_id = ? AND day >= ?
+            ) GROUP BY key
+        ''', (group_id, since_hour, group_id, since_hour // 24))
+        rows = await cursor.fetchall()
+    stats = dict(rows)
+    for key, value in _pending_group_stats(group_id, since_hour).items():
+        stats[key] = stats.get(key, 0) + value
+    return stats
+
+# Time every public database call, labelled by function name. Callers import
+# the wrapped functions, internal calls go through them too.
+for _name, _func in list(globals().items()):
+    if inspect.iscoroutinefunction(_func) and _func.__module__ == __name__ and not _name.startswith("_"):
+        globals()[_name] = timed(DB_DURATION)(_func)
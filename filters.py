@@ -1,6 +1,7 @@
 from aiogram.filters import BaseFilter
 from aiogram.types import Message, CallbackQuery
 from config import OWNER_ID
+from utils.members import is_chat_admin, get_chat_admins, get_bot_rights
 
 class IsGroup(BaseFilter):
     async def __call__(self, message: Message) -> bool:
@@ -10,16 +11,15 @@ class IsAdmin(BaseFilter):
     async def __call__(self, message: Message) -> bool:
         if message.from_user.id == OWNER_ID:
             return True
-        member = await message.chat.get_member(message.from_user.id)
-        return member.status in ["administrator", "creator"]
+        return await is_chat_admin(message.bot, message.chat.id, message.from_user.id)
 
 class IsBotAdmin(BaseFilter):
     async def __call__(self, message: Message) -> bool:
-        bot = await message.bot.me()
-        member = await message.chat.get_member(bot.id)
-        return member.status in ["administrator", "creator"]
+        rights = await get_bot_rights(message.bot, message.chat.id)
+        return rights.is_admin
 
 class IsOwner(BaseFilter):
     async def __call__(self, message: Message) -> bool:
-        member = await message.chat.get_member(message.from_user.id)
-        return member.status == "creator"
\ No newline at end of file
+        admins = await get_chat_admins(message.bot, message.chat.id)
+        member = admins.get(message.from_user.id)
+        return member is not None and member.status == "creator"
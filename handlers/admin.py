@@ -1,16 +1,18 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, ChatMemberUpdated
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters import Command
 
 from filters import IsGroup, IsAdmin
-from keyboards.inline import main_panel, moderation_panel, settings_panel, advanced_settings_panel, close_button
-from database import get_group_settings, update_group_setting, get_all_stats, increment_stat
+from keyboards.inline import main_panel, moderation_panel, settings_panel, advanced_settings_panel, stats_panel
+from database import get_group_settings, update_group_setting, get_all_stats, get_stats_since, increment_stat
 from utils.logger import log_action
+from utils.members import update_bot_rights
 from config import LOG_CHANNEL_ID
 
 import re
+import time
 
 router = Router()
 
@@ -19,6 +21,11 @@ class SettingsFSM(StatesGroup):
     waiting_flood_limit = State()
     waiting_rules = State()
 
+# Bot added, removed, promoted or demoted: refresh the cached bot rights
+@router.my_chat_member()
+async def on_bot_member_update(event: ChatMemberUpdated):
+    update_bot_rights(event.chat.id, event.new_chat_member)
+
 # /panel command
 @router.message(Command("panel"), IsGroup(), IsAdmin())
 async def cmd_panel(message: Message):
@@ -46,16 +53,34 @@ async def open_advanced(callback: CallbackQuery):
     await callback.message.edit_text("⚙️ Advanced Settings", reply_markup=advanced_settings_panel())
     await callback.answer()
 
+def format_stats(stats: dict) -> str:
+    text = f"💬 Messages: {stats.get('messages', 0)}\n"
+    text += f"📥 Joins: {stats.get('joins', 0)}\n"
+    text += f"🚫 Bans: {stats.get('total_bans', 0)}\n"
+    text += f"⚠️ Warnings: {stats.get('total_warnings', 0)}\n"
+    text += f"🗑 Deleted messages: {stats.get('deleted_messages', 0)}"
+    return text
+
 @router.callback_query(F.data == "panel_stats")
 async def show_stats(callback: CallbackQuery):
     stats = await get_all_stats(callback.message.chat.id)
     total_members = await callback.message.chat.get_member_count()
-    text = f"📊 **Group Stats**\n\n"
+    text = f"📊 <b>Group Stats</b> (all time)\n\n"
     text += f"👥 Total members: {total_members}\n"
-    text += f"🚫 Total bans: {stats.get('total_bans', 0)}\n"
-    text += f"⚠️ Total warnings: {stats.get('total_warnings', 0)}\n"
-    text += f"🗑 Deleted messages: {stats.get('deleted_messages', 0)}"
-    await callback.message.edit_text(text, reply_markup=close_button())
+    text += format_stats(stats)
+    await callback.message.edit_text(text, reply_markup=stats_panel())
+    await callback.answer()
+
+STATS_RANGES = {"24h": 86400, "7d": 7 * 86400, "30d": 30 * 86400}
+
+# Served from the pre-aggregated hourly/daily buckets
+@router.callback_query(F.data.in_({f"stats_{name}" for name in STATS_RANGES}))
+async def show_stats_range(callback: CallbackQuery):
+    name = callback.data.replace("stats_", "")
+    stats = await get_stats_since(callback.message.chat.id, int(time.time()) - STATS_RANGES[name])
+    text = f"📊 <b>Group Stats</b> (last {name})\n\n"
+    text += format_stats(stats)
+    await callback.message.edit_text(text, reply_markup=stats_panel())
     await callback.answer()
 
 @router.callback_query(F.data == "panel_close")
@@ -79,11 +104,10 @@ async def toggle_setting(callback: CallbackQuery):
     if not db_key:
         await callback.answer("Invalid setting")
         return
-    current = settings[db_key]
+    current = getattr(settings, db_key)
     new_value = 0 if current else 1
-    await update_group_setting(chat_id, db_key, new_value)
+    settings = await update_group_setting(chat_id, db_key, new_value)
     # Update message
-    settings[db_key] = bool(new_value)
     await callback.message.edit_reply_markup(reply_markup=settings_panel(settings))
     await callback.answer(f"✅ {setting.capitalize()} toggled {'ON' if new_value else 'OFF'}")
 
@@ -2,13 +2,16 @@ import asyncio
 import re
 from datetime import datetime, timedelta
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, ChatPermissions
 from aiogram.filters import Command
 from aiogram.exceptions import TelegramBadRequest
 
 from filters import IsGroup, IsAdmin, IsBotAdmin
-from database import add_warning, get_warnings_count, reset_warnings, add_mute, remove_mute, get_mute_until, add_ban, increment_stat
+from database import warn_user, get_warnings_count, add_mute, remove_mute, get_mute_until, add_ban, increment_stat
 from utils.permissions import check_bot_admin, can_act_on_user
+from utils.members import get_member
+from utils.scheduler import schedule, job_handler
+from utils.purge import purge_messages, throttled
 from utils.time_parser import parse_time
 from utils.logger import log_action
 from keyboards.inline import moderation_panel
@@ -31,7 +34,8 @@ async def get_target_user(message: Message):
         else:
             try:
                 user_id = int(arg)
-                return await message.bot.get_chat_member(message.chat.id, user_id)
+                member = await get_member(message.bot, message.chat.id, user_id)
+                return member.user
             except:
                 return None
     return None
@@ -39,12 +43,12 @@ async def get_target_user(message: Message):
 # Ban command
 @router.message(Command("ban"), IsGroup(), IsAdmin())
 async def cmd_ban(message: Message, bot: Bot):
-    if not await check_bot_admin(message, bot):
-        return await message.reply("❌ I'm not an admin here.")
+    if not await check_bot_admin(message, bot, "can_restrict_members"):
+        return await message.reply("❌ I need admin rights to restrict members here.")
     target = await get_target_user(message)
     if not target:
         return await message.reply("Reply to a user or provide user ID.")
-    if not await can_act_on_user(message, target.user):
+    if not await can_act_on_user(message, target):
         return
     # Parse duration and reason
     parts = message.text.split()
@@ -59,14 +63,13 @@ async def cmd_ban(message: Message, bot: Bot):
         else:
             reason = " ".join(parts[2:])
     try:
-        await message.chat.ban(target.user.id)
-        await add_ban(message.chat.id, target.user.id, message.from_user.id, reason, int(time.time()), duration)
-        await increment_stat(message.chat.id, "total_bans")
+        await message.chat.ban(target.id)
+        await add_ban(message.chat.id, target.id, message.from_user.id, reason, int(time.time()), duration)
         # If duration, schedule unban
         if duration:
-            asyncio.create_task(scheduled_unban(message.chat.id, target.user.id, duration, bot))
-        await message.reply(f"✅ Banned {target.user.full_name}.\nReason: {reason}")
-        await log_action(message.chat.id, "ban", target.user, message.from_user, reason, duration)
+            await schedule("unban", time.time() + duration, message.chat.id, target.id)
+        await message.reply(f"✅ Banned {target.full_name}.\nReason: {reason}")
+        await log_action(message.chat.id, "ban", target, message.from_user, reason, duration)
         # Auto-delete command
         await asyncio.sleep(5)
         await message.delete()
@@ -74,19 +77,20 @@ async def cmd_ban(message: Message, bot: Bot):
         await message.reply(f"❌ Failed: {e}")
 
 # Scheduled unban
-async def scheduled_unban(chat_id, user_id, duration, bot):
-    await asyncio.sleep(duration)
-    try:
-        await bot.unban_chat_member(chat_id, user_id)
-        await remove_mute(chat_id, user_id)  # in case it was a mute
-    except:
-        pass
+@job_handler("unban")
+async def scheduled_unban(bot: Bot, job):
+    await bot.unban_chat_member(job.group_id, job.user_id, only_if_banned=True)
+
+# Timed mute expired: Telegram lifts the restriction itself, drop our record
+@job_handler("unmute")
+async def scheduled_unmute(bot: Bot, job):
+    await remove_mute(job.group_id, job.user_id)
 
 # Unban
 @router.message(Command("unban"), IsGroup(), IsAdmin())
 async def cmd_unban(message: Message, bot: Bot):
-    if not await check_bot_admin(message, bot):
-        return await message.reply("❌ I'm not an admin here.")
+    if not await check_bot_admin(message, bot, "can_restrict_members"):
+        return await message.reply("❌ I need admin rights to restrict members here.")
     try:
         user_id = int(message.text.split()[1])
         await bot.unban_chat_member(message.chat.id, user_id)
@@ -97,12 +101,12 @@ async def cmd_unban(message: Message, bot: Bot):
 # Mute (restrict sending messages)
 @router.message(Command("mute"), IsGroup(), IsAdmin())
 async def cmd_mute(message: Message, bot: Bot):
-    if not await check_bot_admin(message, bot):
-        return await message.reply("❌ I'm not an admin here.")
+    if not await check_bot_admin(message, bot, "can_restrict_members"):
+        return await message.reply("❌ I need admin rights to restrict members here.")
     target = await get_target_user(message)
     if not target:
         return await message.reply("Reply to a user or provide user ID.")
-    if not await can_act_on_user(message, target.user):
+    if not await can_act_on_user(message, target):
         return
     parts = message.text.split()
     duration = 0
@@ -118,14 +122,14 @@ async def cmd_mute(message: Message, bot: Bot):
     try:
         await bot.restrict_chat_member(
             message.chat.id,
-            target.user.id,
+            target.id,
             permissions=ChatPermissions(can_send_messages=False),
             until_date=until_date if duration else None
         )
         if duration:
-            await add_mute(message.chat.id, target.user.id, until_date)
-        await message.reply(f"✅ Muted {target.user.full_name}.\nReason: {reason}")
-        await log_action(message.chat.id, "mute", target.user, message.from_user, reason, duration)
+            await add_mute(message.chat.id, target.id, until_date)
+        await message.reply(f"✅ Muted {target.full_name}.\nReason: {reason}")
+        await log_action(message.chat.id, "mute", target, message.from_user, reason, duration)
         await asyncio.sleep(5)
         await message.delete()
     except Exception as e:
@@ -134,20 +138,20 @@ async def cmd_mute(message: Message, bot: Bot):
 # Unmute
 @router.message(Command("unmute"), IsGroup(), IsAdmin())
 async def cmd_unmute(message: Message, bot: Bot):
-    if not await check_bot_admin(message, bot):
-        return await message.reply("❌ I'm not an admin here.")
+    if not await check_bot_admin(message, bot, "can_restrict_members"):
+        return await message.reply("❌ I need admin rights to restrict members here.")
     target = await get_target_user(message)
     if not target:
         return await message.reply("Reply to a user or provide user ID.")
     try:
         await bot.restrict_chat_member(
             message.chat.id,
-            target.user.id,
+            target.id,
             permissions=ChatPermissions(can_send_messages=True)
         )
-        await remove_mute(message.chat.id, target.user.id)
-        await message.reply(f"✅ Unmuted {target.user.full_name}")
-        await log_action(message.chat.id, "unmute", target.user, message.from_user)
+        await remove_mute(message.chat.id, target.id)
+        await message.reply(f"✅ Unmuted {target.full_name}")
+        await log_action(message.chat.id, "unmute", target, message.from_user)
         await asyncio.sleep(5)
         await message.delete()
     except Exception as e:
@@ -156,33 +160,27 @@ async def cmd_unmute(message: Message, bot: Bot):
 # Warn
 @router.message(Command("warn"), IsGroup(), IsAdmin())
 async def cmd_warn(message: Message, bot: Bot):
-    if not await check_bot_admin(message, bot):
-        return await message.reply("❌ I'm not an admin here.")
+    if not await check_bot_admin(message, bot, "can_restrict_members"):
+        return await message.reply("❌ I need admin rights to restrict members here.")
     target = await get_target_user(message)
     if not target:
         return await message.reply("Reply to a user or provide user ID.")
-    if not await can_act_on_user(message, target.user):
+    if not await can_act_on_user(message, target):
         return
     parts = message.text.split()
     reason = " ".join(parts[2:]) if len(parts) > 2 else "No reason"
-    timestamp = int(time.time())
-    await add_warning(message.chat.id, target.user.id, message.from_user.id, reason, timestamp)
-    warn_count = await get_warnings_count(message.chat.id, target.user.id)
-    settings = await get_group_settings(message.chat.id)
-    warn_limit = settings["warn_limit"]
-    await message.reply(f"⚠️ {target.user.full_name} warned ({warn_count}/{warn_limit}).\nReason: {reason}")
-    await increment_stat(message.chat.id, "total_warnings")
-    await log_action(message.chat.id, "warn", target.user, message.from_user, reason)
-    if warn_count >= warn_limit:
-        # Auto mute
+    # Warning, limit check and auto-mute bookkeeping happen in one transaction
+    result = await warn_user(message.chat.id, target.id, message.from_user.id, reason, int(time.time()))
+    await message.reply(f"⚠️ {target.full_name} warned ({result.count}/{result.limit}).\nReason: {reason}")
+    await log_action(message.chat.id, "warn", target, message.from_user, reason)
+    if result.escalated:
+        # Auto mute, permanent until unmute
         await bot.restrict_chat_member(
             message.chat.id,
-            target.user.id,
+            target.id,
             permissions=ChatPermissions(can_send_messages=False)
         )
-        await add_mute(message.chat.id, target.user.id, 0)  # permanent until unmute
-        await message.reply(f"🔇 {target.user.full_name} auto-muted for reaching warn limit.")
-        await reset_warnings(message.chat.id, target.user.id)
+        await message.reply(f"🔇 {target.full_name} auto-muted for reaching warn limit.")
 
 # Warnings command
 @router.message(Command("warnings"), IsGroup())
@@ -196,18 +194,18 @@ async def cmd_warnings(message: Message):
 # Kick
 @router.message(Command("kick"), IsGroup(), IsAdmin())
 async def cmd_kick(message: Message, bot: Bot):
-    if not await check_bot_admin(message, bot):
-        return await message.reply("❌ I'm not an admin here.")
+    if not await check_bot_admin(message, bot, "can_restrict_members"):
+        return await message.reply("❌ I need admin rights to restrict members here.")
     target = await get_target_user(message)
     if not target:
         return await message.reply("Reply to a user or provide user ID.")
-    if not await can_act_on_user(message, target.user):
+    if not await can_act_on_user(message, target):
         return
     try:
-        await bot.ban_chat_member(message.chat.id, target.user.id)
-        await bot.unban_chat_member(message.chat.id, target.user.id)  # kick = ban then unban
-        await message.reply(f"✅ Kicked {target.user.full_name}")
-        await log_action(message.chat.id, "kick", target.user, message.from_user)
+        await bot.ban_chat_member(message.chat.id, target.id)
+        await bot.unban_chat_member(message.chat.id, target.id)  # kick = ban then unban
+        await message.reply(f"✅ Kicked {target.full_name}")
+        await log_action(message.chat.id, "kick", target, message.from_user)
         await asyncio.sleep(5)
         await message.delete()
     except Exception as e:
@@ -216,6 +214,8 @@ async def cmd_kick(message: Message, bot: Bot):
 # Pin
 @router.message(Command("pin"), IsGroup(), IsAdmin())
 async def cmd_pin(message: Message, bot: Bot):
+    if not await check_bot_admin(message, bot, "can_pin_messages"):
+        return await message.reply("❌ I need admin rights to pin messages here.")
     if not message.reply_to_message:
         return await message.reply("Reply to a message to pin.")
     try:
@@ -227,6 +227,8 @@ async def cmd_pin(message: Message, bot: Bot):
 # Unpin
 @router.message(Command("unpin"), IsGroup(), IsAdmin())
 async def cmd_unpin(message: Message, bot: Bot):
+    if not await check_bot_admin(message, bot, "can_pin_messages"):
+        return await message.reply("❌ I need admin rights to pin messages here.")
     try:
         if message.reply_to_message:
             await bot.unpin_chat_message(message.chat.id, message.reply_to_message.message_id)
@@ -239,27 +241,30 @@ async def cmd_unpin(message: Message, bot: Bot):
 # Purge
 @router.message(Command("purge"), IsGroup(), IsAdmin())
 async def cmd_purge(message: Message, bot: Bot):
+    if not await check_bot_admin(message, bot, "can_delete_messages"):
+        return await message.reply("❌ I need admin rights to delete messages here.")
     if not message.reply_to_message:
         return await message.reply("Reply to a message to purge from there.")
     try:
         start_id = message.reply_to_message.message_id
         end_id = message.message_id
-        count = 0
-        for msg_id in range(start_id, end_id + 1):
-            try:
-                await bot.delete_message(message.chat.id, msg_id)
-                count += 1
-                await asyncio.sleep(0.1)  # avoid flood
-            except:
-                pass
-        await message.answer(f"✅ Purged {count} messages.")
-        await increment_stat(message.chat.id, "deleted_messages", count)
+        status = await message.answer(f"🧹 Purging {end_id - start_id + 1} messages...")
+
+        async def report(done, total):
+            await status.edit_text(f"🧹 Purging... {done}/{total}")
+
+        count = await purge_messages(bot, message.chat.id, start_id, end_id, throttled(report))
+        # deleteMessages does not report how many ids existed, so the range
+        # stays out of the deleted_messages stat
+        await status.edit_text(f"✅ Purge done, processed {count} message ids.")
     except Exception as e:
         await message.reply(f"❌ Failed: {e}")
 
 # Del (delete replied)
 @router.message(Command("del"), IsGroup(), IsAdmin())
 async def cmd_del(message: Message, bot: Bot):
+    if not await check_bot_admin(message, bot, "can_delete_messages"):
+        return await message.reply("❌ I need admin rights to delete messages here.")
     if not message.reply_to_message:
         return await message.reply("Reply to a message to delete.")
     try:
@@ -1,9 +1,14 @@
+import html
+import re
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command
 from filters import IsGroup
-from database import get_group_settings, get_command, list_commands, add_command, remove_command
+from database import get_group_settings, update_group_setting, get_command, list_commands, add_command, remove_command, list_filters
 from utils.permissions import is_admin
+from utils.members import get_member, get_chat_admins
+from utils.reports import send_report
+from utils.word_filter import add_pattern, remove_pattern
 
 router = Router()
 
@@ -25,20 +30,20 @@ async def cmd_info(message: Message):
         user = message.reply_to_message.from_user
     else:
         user = message.from_user
-    member = await message.chat.get_member(user.id)
+    member = await get_member(message.bot, message.chat.id, user.id)
     text = f"**User Info**\n"
     text += f"Name: {user.full_name}\n"
     text += f"ID: `{user.id}`\n"
-    text += f"Status: {member.status}\n"
-    text += f"Joined: {member.joined_date}"
+    # The Bot API does not expose join dates
+    text += f"Status: {member.status}"
     await message.reply(text)
 
 # Admins list
 @router.message(Command("admins"), IsGroup())
 async def cmd_admins(message: Message):
-    admins = await message.chat.get_administrators()
+    admins = await get_chat_admins(message.bot, message.chat.id)
     text = "**Admins:**\n"
-    for admin in admins:
+    for admin in admins.values():
         text += f"- {admin.user.full_name} (`{admin.user.id}`)\n"
     await message.reply(text)
 
@@ -47,23 +52,20 @@ async def cmd_admins(message: Message):
 async def cmd_report(message: Message):
     if not message.reply_to_message:
         return await message.reply("Reply to a message to report it.")
-    admins = await message.chat.get_administrators()
-    report_text = f"🚨 Report from {message.from_user.full_name}\n"
-    report_text += f"Message: {message.reply_to_message.text or 'Media'}\n"
+    report_text = f"🚨 Report from {html.escape(message.from_user.full_name)}\n"
+    report_text += f"Message: {html.escape(message.reply_to_message.text or 'Media')}\n"
     report_text += f"Link: https://t.me/c/{str(message.chat.id)[4:]}/{message.reply_to_message.message_id}"
-    for admin in admins:
-        if not admin.user.is_bot:
-            try:
-                await message.bot.send_message(admin.user.id, report_text)
-            except:
-                pass
-    await message.reply("Report sent to admins.")
+    delivered = await send_report(message.bot, message.chat.id, report_text)
+    if delivered:
+        await message.reply(f"Report sent to {delivered} admin(s).")
+    else:
+        await message.reply("Couldn't reach any admin. Admins need to start a private chat with me to get reports.")
 
 # Rules
 @router.message(Command("rules"), IsGroup())
 async def cmd_rules(message: Message):
     settings = await get_group_settings(message.chat.id)
-    rules = settings.get("rules", "No rules set.")
+    rules = settings.rules or "No rules set."
     await message.reply(f"📜 Rules:\n{rules}")
 
 # Set rules (admin)
@@ -110,11 +112,55 @@ async def cmd_commands(message: Message):
         text = "No custom commands."
     await message.reply(text)
 
+# Word filters
+@router.message(Command("addfilter"), IsGroup())
+async def cmd_addfilter(message: Message):
+    if not await is_admin(message):
+        return
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        return await message.reply("Usage: /addfilter <word> or /addfilter re:<regex>")
+    pattern = parts[1].strip()
+    is_regex = pattern.startswith("re:")
+    pattern = pattern[3:] if is_regex else pattern.lower()
+    try:
+        await add_pattern(message.chat.id, pattern, is_regex)
+    except re.error as e:
+        return await message.reply(f"❌ Invalid regex: {html.escape(str(e))}")
+    await message.reply(f"✅ Filter added: {html.escape(pattern)}")
+
+@router.message(Command("delfilter"), IsGroup())
+async def cmd_delfilter(message: Message):
+    if not await is_admin(message):
+        return
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        return await message.reply("Usage: /delfilter <word or regex>")
+    pattern = parts[1].strip()
+    pattern = pattern[3:] if pattern.startswith("re:") else pattern.lower()
+    if await remove_pattern(message.chat.id, pattern):
+        await message.reply(f"✅ Filter removed: {html.escape(pattern)}")
+    else:
+        await message.reply("No such filter.")
+
+@router.message(Command("filters"), IsGroup())
+async def cmd_filters(message: Message):
+    filters = await list_filters(message.chat.id)
+    if filters:
+        text = "Blocked words:\n" + "\n".join([f"- {'re:' if is_regex else ''}{html.escape(pattern)}" for pattern, is_regex in filters])
+    else:
+        text = "No filters."
+    await message.reply(text)
+
 # Handle custom commands dynamically
 @router.message(IsGroup())
 async def handle_custom_commands(message: Message):
-    if message.text and message.text.startswith("/"):
-        cmd = message.text[1:].split()[0].lower()
+    if message.text and len(message.text) > 1 and message.text.startswith("/"):
+        # Served from the in-memory command index, unknown commands cost no I/O
+        parts = message.text[1:].split(maxsplit=1)
+        if not parts:
+            return
+        cmd = parts[0].split("@")[0].lower()
         response = await get_command(message.chat.id, cmd)
         if response:
             await message.reply(response)
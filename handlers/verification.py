@@ -1,7 +1,6 @@
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
-from database import add_verified
-import time
+from utils.captcha import captcha
 
 router = Router()
 
@@ -13,6 +12,16 @@ async def verify_callback(callback: CallbackQuery):
     if callback.from_user.id != user_id:
         await callback.answer("This verification is not for you.", show_alert=True)
         return
-    await add_verified(chat_id, user_id, int(time.time()))
+    await captcha.verify(chat_id, user_id)
     await callback.message.edit_text("✅ You have been verified! Welcome.")
     await callback.answer("Verified!")
+
+# Shared button posted for a batch of joins during a raid
+@router.callback_query(F.data.startswith("verifyall_"))
+async def verify_batch_callback(callback: CallbackQuery):
+    chat_id = int(callback.data.split("_")[1])
+    if not captcha.is_pending(chat_id, callback.from_user.id):
+        await callback.answer("This verification is not for you.", show_alert=True)
+        return
+    await captcha.verify(chat_id, callback.from_user.id)
+    await callback.answer("✅ You have been verified! Welcome.", show_alert=True)
@@ -1,54 +1,78 @@
-from aiogram import Router, F
+import html
+from functools import partial
+from aiogram import Router, F, Bot
 from aiogram.types import Message, ChatMemberUpdated
 from aiogram.filters import ChatMemberUpdatedFilter, JOIN_TRANSITION, LEAVE_TRANSITION
 
-from database import get_group_settings, add_verified
-from keyboards.inline import verification_keyboard
-from config import WELCOME_MESSAGE, GOODBYE_MESSAGE
-import time
+from database import get_group_settings, increment_stat
+from keyboards.inline import verification_keyboard, batch_verification_keyboard
+from utils.captcha import captcha
+from utils.join_burst import JoinCoalescer
+from utils.rate_limiter import outbound_priority, Priority
+from config import WELCOME_MESSAGE, GOODBYE_MESSAGE, DEFAULT_CAPTCHA_TIMEOUT
 
 router = Router()
 
+joins = JoinCoalescer()
+
 @router.chat_member(ChatMemberUpdatedFilter(member_status_changed=JOIN_TRANSITION))
 async def on_user_join(event: ChatMemberUpdated):
     chat = event.chat
     user = event.new_chat_member.user
+    await increment_stat(chat.id, "joins")
     settings = await get_group_settings(chat.id)
-    if not settings["welcome_enabled"]:
+    if not settings.welcome_enabled:
+        return
+    if joins.is_burst(chat.id):
+        # Join raid: one message for the whole batch instead of one per user
+        if settings.verification_enabled:
+            joins.add((chat.id, "captcha"), user, partial(send_batch_verification, event.bot, chat.id))
+        else:
+            joins.add((chat.id, "welcome"), user, partial(send_batch_welcome, event.bot, chat))
         return
     # Check verification
-    if settings["verification_enabled"]:
+    if settings.verification_enabled:
         # Send captcha
-        await send_verification(chat.id, user)
+        await send_verification(event.bot, chat.id, user)
     else:
         # Send normal welcome
         text = WELCOME_MESSAGE.format(name=user.full_name, group=chat.title)
-        await event.bot.send_message(chat.id, text)
+        with outbound_priority(Priority.COSMETIC):
+            await event.bot.send_message(chat.id, text)
 
 @router.chat_member(ChatMemberUpdatedFilter(member_status_changed=LEAVE_TRANSITION))
 async def on_user_leave(event: ChatMemberUpdated):
     chat = event.chat
     user = event.old_chat_member.user
+    # Nothing left to kick once they are gone
+    await captcha.discard(chat.id, user.id)
     settings = await get_group_settings(chat.id)
-    if settings.get("goodbye_enabled", True):
+    if settings.goodbye_enabled:
         text = GOODBYE_MESSAGE.format(name=user.full_name)
-        await event.bot.send_message(chat.id, text)
+        with outbound_priority(Priority.COSMETIC):
+            await event.bot.send_message(chat.id, text)
 
-async def send_verification(chat_id: int, user):
+async def send_verification(bot: Bot, chat_id: int, user):
     # Simple button captcha
     keyboard = verification_keyboard(chat_id, user.id)
     text = f"Welcome {user.full_name}! Please click the button to verify you're human."
-    msg = await event.bot.send_message(chat_id, text, reply_markup=keyboard)
-    # Schedule kick after timeout
-    asyncio.create_task(auto_kick_unverified(chat_id, user.id, msg.message_id))
-
-async def auto_kick_unverified(chat_id, user_id, msg_id, timeout=60):
-    await asyncio.sleep(timeout)
-    # Check if user is verified (we can store in DB)
-    if not await is_verified(chat_id, user_id):
-        try:
-            await bot.kick_chat_member(chat_id, user_id)
-            await bot.unban_chat_member(chat_id, user_id)  # kick
-            await bot.edit_message_text("User kicked for not verifying.", chat_id, msg_id)
-        except:
-            pass
+    msg = await bot.send_message(chat_id, text, reply_markup=keyboard)
+    # Kicked by the captcha sweeper unless verified before the timeout
+    await captcha.add(chat_id, [user.id], DEFAULT_CAPTCHA_TIMEOUT, msg.message_id)
+
+def batch_names(users, limit: int = 30):
+    names = ", ".join(html.escape(user.full_name) for user in users[:limit])
+    if len(users) > limit:
+        names += f" and {len(users) - limit} more"
+    return names
+
+async def send_batch_welcome(bot: Bot, chat, users):
+    text = WELCOME_MESSAGE.format(name=batch_names(users), group=chat.title)
+    with outbound_priority(Priority.COSMETIC):
+        await bot.send_message(chat.id, text)
+
+async def send_batch_verification(bot: Bot, chat_id: int, users):
+    # One shared button; each newcomer verifies themselves by pressing it
+    text = f"Welcome {batch_names(users)}! Please click the button to verify you're human."
+    await bot.send_message(chat_id, text, reply_markup=batch_verification_keyboard(chat_id))
+    await captcha.add(chat_id, [user.id for user in users], DEFAULT_CAPTCHA_TIMEOUT)
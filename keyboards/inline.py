@@ -33,26 +33,26 @@ def moderation_panel():
     )
     return builder.as_markup()
 
-def settings_panel(settings: dict):
+def settings_panel(settings):
     builder = InlineKeyboardBuilder()
     # Toggle buttons with current status
     builder.row(
         InlineKeyboardButton(
-            text=f"🛡 AntiSpam: {'ON' if settings['anti_spam_enabled'] else 'OFF'}",
+            text=f"🛡 AntiSpam: {'ON' if settings.anti_spam_enabled else 'OFF'}",
             callback_data="toggle_antispam"
         ),
         InlineKeyboardButton(
-            text=f"👋 Welcome: {'ON' if settings['welcome_enabled'] else 'OFF'}",
+            text=f"👋 Welcome: {'ON' if settings.welcome_enabled else 'OFF'}",
             callback_data="toggle_welcome"
         ),
     )
     builder.row(
         InlineKeyboardButton(
-            text=f"🔐 Verify: {'ON' if settings['verification_enabled'] else 'OFF'}",
+            text=f"🔐 Verify: {'ON' if settings.verification_enabled else 'OFF'}",
             callback_data="toggle_verify"
         ),
         InlineKeyboardButton(
-            text=f"🧹 Filter: {'ON' if settings['filter_enabled'] else 'OFF'}",
+            text=f"🧹 Filter: {'ON' if settings.filter_enabled else 'OFF'}",
             callback_data="toggle_filter"
         ),
     )
@@ -79,5 +79,24 @@ def verification_keyboard(chat_id, user_id):
     builder.button(text="✅ Verify", callback_data=f"verify_{chat_id}_{user_id}")
     return builder.as_markup()
 
+def batch_verification_keyboard(chat_id):
+    builder = InlineKeyboardBuilder()
+    builder.button(text="✅ Verify", callback_data=f"verifyall_{chat_id}")
+    return builder.as_markup()
+
+def stats_panel():
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(text="24h", callback_data="stats_24h"),
+        InlineKeyboardButton(text="7d", callback_data="stats_7d"),
+        InlineKeyboardButton(text="30d", callback_data="stats_30d"),
+        InlineKeyboardButton(text="All time", callback_data="panel_stats"),
+    )
+    builder.row(
+        InlineKeyboardButton(text="⬅️ Back", callback_data="panel_main"),
+        InlineKeyboardButton(text="❌ Close", callback_data="panel_close"),
+    )
+    return builder.as_markup()
+
 def close_button():
     return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="❌ Close", callback_data="panel_close")]])
@@ -1,23 +1,68 @@
 import asyncio
 import logging
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
-from config import BOT_TOKEN
-from database import init_db
+from config import (
+    BOT_TOKEN, BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET,
+    WORKERS, OUTBOUND_RATE, METRICS_HOST, METRICS_PORT,
+    RECORD_UPDATES_DIR, RECORD_MAX_MB, RECORD_KEEP,
+)
+from database import init_db, close_db
 from handlers import admin, moderation, welcome, verification, utils, errors
+from middlewares.member_cache import MemberCacheMiddleware
+from middlewares.flood import FloodMiddleware
+from middlewares.stats import MessageStatsMiddleware
+from middlewares.word_filter import WordFilterMiddleware
+from middlewares.metrics import UpdateMetricsMiddleware, HandlerMetricsMiddleware, ApiMetricsMiddleware
+from middlewares.recorder import UpdateRecorder
+from middlewares.command_index import CommandIndexMiddleware
+from utils.members import load_bot_user
+from utils.scheduler import scheduler
+from utils.captcha import captcha
+from utils.logger import action_log
+from utils.fsm_storage import create_storage
+from utils.rate_limiter import OutboundLimiter
+from utils.sharding import shard_index, shard_count
+from utils.metrics import MetricsServer
 
 logging.basicConfig(level=logging.INFO)
 
-async def main():
-    await init_db()
+def create_bot(limiter: bool = True, **kwargs) -> Bot:
     bot = Bot(
         token=BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        **kwargs
     )
-    dp = Dispatcher(storage=MemoryStorage())
+    if limiter:
+        # Workers share the global Bot API limit
+        bot.session.middleware(OutboundLimiter(rate=OUTBOUND_RATE / shard_count()))
+    # Inside the limiter, so only the HTTP call itself is timed
+    bot.session.middleware(ApiMetricsMiddleware())
+    return bot
+
+def create_dispatcher() -> Dispatcher:
+    dp = Dispatcher(storage=create_storage())
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    if RECORD_UPDATES_DIR:
+        # Workers write separate files
+        recorder = UpdateRecorder(
+            RECORD_UPDATES_DIR, RECORD_MAX_MB * 2 ** 20, RECORD_KEEP, prefix=f"updates-{shard_index()}"
+        )
+        dp.update.outer_middleware(recorder)
+        dp.startup.register(recorder.start)
+        dp.shutdown.register(recorder.stop)
+    dp.chat_member.outer_middleware(MemberCacheMiddleware())
+    # Before the filters, so messages they drop are counted too
+    dp.message.outer_middleware(MessageStatsMiddleware())
+    # The word filter loads group settings, which the flood check then reads from cache
+    dp.message.outer_middleware(WordFilterMiddleware())
+    dp.message.outer_middleware(FloodMiddleware())
+    # Last: routes messages to the handlers of the routers below itself
+    dp.message.outer_middleware(CommandIndexMiddleware(dp))
 
     dp.include_router(admin.router)
     dp.include_router(moderation.router)
@@ -26,7 +71,62 @@ async def main():
     dp.include_router(utils.router)
     dp.include_router(errors.router)
 
-    await dp.start_polling(bot)
+    # Inner middlewares of the dispatcher apply to the handlers of every router
+    for update_type in dp.resolve_used_update_types():
+        dp.observers[update_type].middleware(HandlerMetricsMiddleware())
+
+    metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT + shard_index() if METRICS_PORT else 0)
+    dp.startup.register(metrics_server.start)
+    dp.startup.register(load_bot_user)
+    dp.startup.register(action_log.start)
+    dp.startup.register(scheduler.start)
+    dp.startup.register(captcha.start)
+    dp.shutdown.register(captcha.stop)
+    dp.shutdown.register(scheduler.stop)
+    dp.shutdown.register(action_log.stop)
+    dp.shutdown.register(metrics_server.stop)
+    dp.shutdown.register(close_db)
+    return dp
+
+async def run_polling(bot: Bot, dp: Dispatcher):
+    # getUpdates is refused while a webhook is set, e.g. after running in webhook mode
+    await bot.delete_webhook()
+    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+
+async def set_webhook(bot: Bot, dispatcher: Dispatcher):
+    await bot.set_webhook(
+        f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+    )
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    dp.startup.register(set_webhook)
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    logging.info("Listening for webhook updates on %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+async def main():
+    await init_db()
+    bot = create_bot()
+    dp = create_dispatcher()
+    if WORKERS > 1:
+        from supervisor import run_supervisor
+        # Workers open their own connections once the schema exists
+        await close_db()
+        await run_supervisor(bot, dp, WORKERS)
+    elif BOT_MODE == "webhook":
+        await run_webhook(bot, dp)
+    else:
+        await run_polling(bot, dp)
 
 
 if __name__ == "__main__":
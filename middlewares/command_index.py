@@ -0,0 +1,100 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Router
+from aiogram.dispatcher.event.bases import UNHANDLED, SkipHandler
+from aiogram.dispatcher.middlewares.manager import MiddlewareManager
+from aiogram.filters import Command
+from aiogram.types import Message
+
+
+class CommandIndexMiddleware(BaseMiddleware):
+    """Dispatches messages through a precomputed command index.
+
+    Without it every message is checked against the filters of each message
+    handler of every router in turn. The index maps a command name to the
+    handlers that could take it: those whose Command filter names it, plus every
+    handler without a Command filter, in their normal dispatch order. Other
+    messages only go through the handlers without a Command filter. The
+    remaining filters and the inner middlewares still run for each candidate,
+    so behaviour is unchanged.
+
+    Must be the last outer middleware of ``dp.message``; it takes over the
+    propagation to the routers. Routers with their own message outer
+    middlewares or router-level filters cannot be indexed, the index is then
+    bypassed.
+    """
+
+    def __init__(self, root: Router):
+        self.root = root
+        self._built = False
+        self._enabled = False
+        self._commands = {}
+        self._plain = []
+
+    def _candidate(self, router: Router, handler):
+        observer = router.message
+        # The same chain observer.trigger would build, done once
+        call = MiddlewareManager.wrap_middlewares(observer._resolve_middlewares(), handler.call)
+        return router, handler, call
+
+    def _build(self):
+        self._built = True
+        for router in self.root.chain_tail:
+            if router.message._handler.filters or (router is not self.root and router.message.outer_middleware):
+                return
+        for router in self.root.chain_tail:
+            for handler in router.message.handlers:
+                candidate = self._candidate(router, handler)
+                names = self._command_names(handler)
+                if names is None:
+                    self._plain.append(candidate)
+                    for candidates in self._commands.values():
+                        candidates.append(candidate)
+                    continue
+                for name in names:
+                    self._commands.setdefault(name, list(self._plain)).append(candidate)
+        self._enabled = True
+
+    @staticmethod
+    def _command_names(handler):
+        """Casefolded command names a handler is limited to, None if it is not."""
+        for filter_object in handler.filters or ():
+            command = filter_object.callback
+            if not isinstance(command, Command):
+                continue
+            # Regex commands and other prefixes could match anything
+            if command.prefix != "/" or not all(isinstance(name, str) for name in command.commands):
+                return None
+            return {name.casefold() for name in command.commands}
+        return None
+
+    def _candidates(self, message: Message):
+        text = message.text or message.caption
+        if text and text.startswith("/"):
+            name = text.split(maxsplit=1)[0][1:].partition("@")[0].casefold()
+            candidates = self._commands.get(name)
+            if candidates is not None:
+                return candidates
+        return self._plain
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not self._built:
+            self._build()
+        if not self._enabled:
+            return await handler(event, data)
+        for router, handler_object, call in self._candidates(event):
+            kwargs = {**data, "event_router": router, "handler": handler_object}
+            result, extra = await handler_object.check(event, **kwargs)
+            if not result:
+                continue
+            kwargs.update(extra)
+            try:
+                return await call(event, kwargs)
+            except SkipHandler:
+                continue
+        return UNHANDLED
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, ChatPermissions
+
+from config import (
+    DEFAULT_FLOOD_LIMIT, DEFAULT_ANTI_SPAM, FLOOD_WINDOW, FLOOD_MUTE_DURATION, FLOOD_MAX_TRACKED,
+)
+from database import peek_group_settings, get_group_settings, add_mute
+from utils.members import is_chat_admin, get_bot_rights, get_bot_user
+from utils.logger import log_action
+
+
+class FloodMiddleware(BaseMiddleware):
+    """Mutes users sending more than flood_limit messages per FLOOD_WINDOW seconds.
+
+    Each (chat, user) keeps a ring buffer of its last flood_limit + 1 message
+    times, so a check is a single append and compare. Entries are kept in
+    least-recently-active order and dropped once idle for a whole window.
+    """
+
+    def __init__(self, window: float = FLOOD_WINDOW, mute_duration: int = FLOOD_MUTE_DURATION,
+                 max_tracked: int = FLOOD_MAX_TRACKED):
+        self.window = window
+        self.mute_duration = mute_duration
+        self.max_tracked = max_tracked
+        self._recent = OrderedDict()
+        self._warming = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        if event.chat.type not in ("group", "supergroup") or not event.from_user or event.from_user.is_bot:
+            return await handler(event, data)
+        settings = peek_group_settings(event.chat.id)
+        if settings is None:
+            # Settings are loaded off the hot path; use defaults until then
+            self._warm(event.chat.id)
+            enabled, limit = DEFAULT_ANTI_SPAM, DEFAULT_FLOOD_LIMIT
+        else:
+            enabled, limit = settings.anti_spam_enabled, settings.flood_limit
+        if enabled and limit > 0 and self.hit(event.chat.id, event.from_user.id, limit):
+            if await self.punish(event):
+                return None
+        return await handler(event, data)
+
+    def hit(self, chat_id: int, user_id: int, limit: int) -> bool:
+        now = time.monotonic()
+        self._evict(now)
+        key = (chat_id, user_id)
+        stamps = self._recent.get(key)
+        if stamps is None or stamps.maxlen != limit + 1:
+            stamps = deque(stamps or (), maxlen=limit + 1)
+            self._recent[key] = stamps
+        # Reassigning an existing key keeps its old position
+        self._recent.move_to_end(key)
+        stamps.append(now)
+        return len(stamps) > limit and now - stamps[0] <= self.window
+
+    def _evict(self, now: float):
+        recent = self._recent
+        while recent:
+            stamps = recent[next(iter(recent))]
+            if len(recent) <= self.max_tracked and now - stamps[-1] <= self.window:
+                break
+            recent.popitem(last=False)
+
+    def _warm(self, chat_id: int):
+        if chat_id in self._warming:
+            return
+        self._warming.add(chat_id)
+        task = asyncio.create_task(get_group_settings(chat_id))
+        task.add_done_callback(lambda _: self._warming.discard(chat_id))
+
+    async def punish(self, message: Message) -> bool:
+        chat_id, user = message.chat.id, message.from_user
+        self._recent.pop((chat_id, user.id), None)
+        rights = await get_bot_rights(message.bot, chat_id)
+        if not rights.can_restrict_members or await is_chat_admin(message.bot, chat_id, user.id):
+            return False
+        until = int(time.time()) + self.mute_duration
+        try:
+            await message.bot.restrict_chat_member(
+                chat_id,
+                user.id,
+                permissions=ChatPermissions(can_send_messages=False),
+                until_date=until,
+            )
+            await add_mute(chat_id, user.id, until)
+            await message.answer(f"🔇 {user.full_name} muted for {self.mute_duration // 60} minutes for flooding.")
+            await log_action(chat_id, "flood", user, get_bot_user() or await message.bot.me(), "Flooding", self.mute_duration)
+        except Exception:
+            logging.exception("Failed to mute flooding user %s in %s", user.id, chat_id)
+            return False
+        return True
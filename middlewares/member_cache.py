@@ -0,0 +1,19 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import ChatMemberUpdated
+
+from utils.members import update_member
+
+
+class MemberCacheMiddleware(BaseMiddleware):
+    """Keeps utils.members in sync with chat_member updates."""
+
+    async def __call__(
+        self,
+        handler: Callable[[ChatMemberUpdated, Dict[str, Any]], Awaitable[Any]],
+        event: ChatMemberUpdated,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_member(event.chat.id, event.new_chat_member)
+        return await handler(event, data)
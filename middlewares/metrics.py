@@ -0,0 +1,69 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import TelegramObject, Update
+
+from utils.metrics import (
+    UPDATES, UPDATE_DURATION, HANDLER_DURATION, HANDLER_ERRORS,
+    API_DURATION, API_ERRORS, API_RATE_LIMITED,
+)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Counts updates and times their whole processing, by update type."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_type = event.event_type
+        UPDATES.inc(update_type)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            UPDATE_DURATION.observe(time.perf_counter() - start, update_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Times the handler picked for an event; registered as an inner middleware."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = data["handler"].callback
+        name = f"{callback.__module__}.{callback.__qualname__}"
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - start, name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Times Bot API requests and counts failures and 429s, by method."""
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            API_RATE_LIMITED.inc(name)
+            raise
+        except Exception:
+            API_ERRORS.inc(name)
+            raise
+        finally:
+            API_DURATION.observe(time.perf_counter() - start, name)
@@ -0,0 +1,91 @@
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateRecorder(BaseMiddleware):
+    """Captures incoming updates for tools/replay.py.
+
+    Each update is stored as one JSON line ``{"ts": ..., "update": {...}}`` in
+    gzip files under ``directory``. Lines are buffered and appended every
+    ``interval`` seconds from a worker thread, each batch as its own gzip member
+    so a crash loses at most the last batch. Files rotate after ``max_bytes``
+    and only the newest ``keep`` are kept.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, keep: int, prefix: str = "updates",
+                 interval: float = 1.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.prefix = prefix
+        self.interval = interval
+        self._buffer = []
+        self._path = None
+        self._task = None
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        if self._task is not None:
+            update = event.model_dump(mode="json", by_alias=True, exclude_none=True)
+            self._buffer.append(json.dumps({"ts": time.time(), "update": update}, ensure_ascii=False) + "\n")
+        return await handler(event, data)
+
+    async def start(self):
+        if self._task is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._flush()
+
+    async def _flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, lines)
+        except OSError as e:
+            logger.warning("Failed to record %s updates: %s", len(lines), e)
+
+    def _write(self, lines):
+        if self._path is None or os.path.getsize(self._path) >= self.max_bytes:
+            self._rotate()
+        with gzip.open(self._path, "at", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    def _rotate(self):
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self._path = os.path.join(self.directory, f"{self.prefix}-{stamp}.ndjson.gz")
+        files = sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}-*.ndjson.gz")))
+        for old in files[:max(0, len(files) - self.keep + 1)]:
+            if old != self._path:
+                os.remove(old)
@@ -0,0 +1,21 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from database import increment_stat
+
+
+class MessageStatsMiddleware(BaseMiddleware):
+    """Counts group messages from human users in the ``messages`` stat."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        if event.chat.type in ("group", "supergroup") and event.from_user and not event.from_user.is_bot:
+            # Buffered in memory, no database call here
+            await increment_stat(event.chat.id, "messages")
+        return await handler(event, data)
@@ -0,0 +1,46 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from config import OWNER_ID
+from database import get_group_settings, increment_stat
+from utils.members import is_chat_admin, get_bot_rights, get_bot_user
+from utils.word_filter import find_blocked
+from utils.logger import log_action
+
+
+class WordFilterMiddleware(BaseMiddleware):
+    """Deletes group messages matching the group's blocked words when filter_enabled is on."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        if event.chat.type not in ("group", "supergroup") or not (event.text or event.caption):
+            return await handler(event, data)
+        settings = await get_group_settings(event.chat.id)
+        if settings.filter_enabled:
+            blocked = await find_blocked(event.chat.id, event.text, event.caption)
+            if blocked and await self.remove(event, blocked):
+                return None
+        return await handler(event, data)
+
+    async def remove(self, message: Message, blocked: str) -> bool:
+        user = message.from_user
+        if user is None or user.id == OWNER_ID or await is_chat_admin(message.bot, message.chat.id, user.id):
+            return False
+        rights = await get_bot_rights(message.bot, message.chat.id)
+        if not rights.can_delete_messages:
+            return False
+        try:
+            await message.delete()
+        except Exception:
+            logging.exception("Failed to delete filtered message in %s", message.chat.id)
+            return False
+        await increment_stat(message.chat.id, "deleted_messages")
+        await log_action(message.chat.id, "filter", user, get_bot_user() or await message.bot.me(), f"Blocked word: {blocked}")
+        return True
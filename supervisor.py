@@ -0,0 +1,195 @@
+import asyncio
+import collections
+import logging
+import multiprocessing
+import secrets
+import signal
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+
+from config import (
+    BOT_MODE, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET, WORKER_STOP_TIMEOUT,
+)
+from database import init_db
+from utils.sharding import set_shard, shard_of, update_chat_id
+
+logger = logging.getLogger(__name__)
+
+POLL_TIMEOUT = 30
+
+
+class Supervisor:
+    """Runs the bot in ``count`` worker processes, each owning a shard of the chats.
+
+    The supervisor only receives raw updates and routes them by
+    ``abs(chat_id) % count``, so a chat is always handled by the same worker:
+    its updates stay in order and the caches of that worker stay authoritative.
+    Workers that die are started again on a fresh queue: a killed worker may
+    still hold the old queue's read lock. Updates left in it are dropped.
+    """
+
+    def __init__(self, count: int):
+        self.count = count
+        self._ctx = multiprocessing.get_context("spawn")
+        self._queues = [None] * count
+        self._processes = [None] * count
+        self._stopping = False
+
+    def _spawn(self, index: int):
+        old = self._queues[index]
+        if old is not None:
+            old.close()
+            old.cancel_join_thread()
+        self._queues[index] = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=worker_main, args=(index, self.count, self._queues[index]), name=f"worker-{index}"
+        )
+        process.start()
+        self._processes[index] = process
+
+    def start(self):
+        for index in range(self.count):
+            self._spawn(index)
+
+    def dispatch(self, update: dict):
+        self._queues[shard_of(update_chat_id(update), self.count)].put(update)
+
+    async def watch(self):
+        while not self._stopping:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self._processes):
+                if not self._stopping and not process.is_alive():
+                    logger.warning("Worker %s exited with code %s, restarting", index, process.exitcode)
+                    self._spawn(index)
+
+    async def stop(self):
+        self._stopping = True
+        loop = asyncio.get_running_loop()
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning("Worker %s did not stop in time, terminating", process.name)
+                process.terminate()
+
+
+def worker_main(index: int, count: int, queue):
+    # Ctrl+C reaches the whole process group; the supervisor decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_worker(index, count, queue))
+
+
+async def _run_worker(index: int, count: int, queue):
+    from main import create_bot, create_dispatcher
+
+    set_shard(index, count)
+    await init_db()
+    bot = create_bot()
+    dp = create_dispatcher()
+    await dp.emit_startup(bot=bot, bots=[bot], dispatcher=dp)
+    logger.info("Worker %s/%s started", index, count)
+
+    # chat_id -> updates not handled yet; one task per chat drains them in order
+    chats = {}
+    tasks = set()
+
+    async def drain(chat_id, pending):
+        while pending:
+            try:
+                await dp.feed_raw_update(bot, pending[0])
+            except Exception:
+                logger.exception("Failed to process update %s", pending[0].get("update_id"))
+            pending.popleft()
+        del chats[chat_id]
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            update = await loop.run_in_executor(None, queue.get)
+            if update is None:
+                break
+            chat_id = update_chat_id(update)
+            pending = chats.get(chat_id)
+            if pending is not None:
+                pending.append(update)
+                continue
+            pending = chats[chat_id] = collections.deque([update])
+            task = asyncio.create_task(drain(chat_id, pending))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+    finally:
+        await dp.emit_shutdown(bot=bot, bots=[bot], dispatcher=dp)
+        await bot.session.close()
+
+
+async def _poll(bot: Bot, supervisor: Supervisor, allowed_updates):
+    # Raw getUpdates: the supervisor never builds Update objects
+    await bot.delete_webhook()
+    url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+    offset = None
+    timeout = aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        while True:
+            params = {"timeout": POLL_TIMEOUT, "allowed_updates": allowed_updates}
+            if offset is not None:
+                params["offset"] = offset
+            try:
+                async with session.post(url, json=params) as response:
+                    result = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("getUpdates failed: %s", e)
+                await asyncio.sleep(1)
+                continue
+            if not result.get("ok"):
+                logger.warning("getUpdates failed: %s", result.get("description"))
+                await asyncio.sleep(result.get("parameters", {}).get("retry_after", 1))
+                continue
+            for update in result["result"]:
+                supervisor.dispatch(update)
+                offset = update["update_id"] + 1
+
+
+async def _serve_webhook(bot: Bot, dp: Dispatcher, supervisor: Supervisor):
+    from main import set_webhook
+
+    async def handle(request: web.Request):
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if WEBHOOK_SECRET and not secrets.compare_digest(token, WEBHOOK_SECRET):
+            return web.Response(status=401)
+        supervisor.dispatch(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    await set_webhook(bot, dp)
+    logger.info("Listening for webhook updates on %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_supervisor(bot: Bot, dp: Dispatcher, count: int):
+    # dp is only used for its update types; the handlers run in the workers
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    supervisor = Supervisor(count)
+    supervisor.start()
+    watcher = asyncio.create_task(supervisor.watch())
+    logger.info("Started %s workers", count)
+    try:
+        if BOT_MODE == "webhook":
+            await _serve_webhook(bot, dp, supervisor)
+        else:
+            await _poll(bot, supervisor, dp.resolve_used_update_types())
+    finally:
+        watcher.cancel()
+        await supervisor.stop()
+        await bot.session.close()
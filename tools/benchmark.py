@@ -0,0 +1,183 @@
+"""Offline load test for the dispatcher.
+
+Builds the real dispatcher from main.py on a mocked Bot session (tools/mock_bot.py)
+and a temporary database, feeds synthetic update streams through
+Dispatcher.feed_update and reports throughput, p50/p99 latency and peak memory
+per scenario. Run from the repository root:
+
+    python -m tools.benchmark
+    python -m tools.benchmark --updates 20000 --scenario messages warn_storm --json results.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import time
+import tracemalloc
+
+from aiogram.types import Update
+
+from tools.harness import percentile, running_dispatcher
+from tools.mock_bot import ADMIN_ID
+
+CHATS = 50
+USERS = 5000
+WORDS = ("hello", "anyone", "here", "price", "today", "thanks", "lol", "when", "moon", "ok", "spamword")
+
+
+def chat(chat_id: int) -> dict:
+    return {"id": chat_id, "type": "supergroup", "title": f"Group {chat_id}"}
+
+
+def user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+
+def group_id(index: int) -> int:
+    return -1000000000000 - index
+
+
+def message(update_id: int, chat_id: int, user_id: int, text: str, reply_to: dict = None) -> dict:
+    msg = {
+        "message_id": update_id, "date": int(time.time()),
+        "chat": chat(chat_id), "from": user(user_id), "text": text,
+    }
+    if text.startswith("/"):
+        msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if reply_to:
+        msg["reply_to_message"] = reply_to
+    return {"update_id": update_id, "message": msg}
+
+
+def messages(n: int, rng: random.Random):
+    for i in range(n):
+        text = " ".join(rng.choices(WORDS, k=rng.randint(1, 12)))
+        yield message(i, group_id(rng.randrange(CHATS)), rng.randrange(1, USERS), text)
+
+
+def commands(n: int, rng: random.Random):
+    names = ("/id", "/rules", "/info", "/commands", "/filters", "/hello", "/unknown")
+    for i in range(n):
+        yield message(i, group_id(rng.randrange(CHATS)), rng.randrange(1, USERS), rng.choice(names))
+
+
+def join_raid(n: int, rng: random.Random):
+    chat_id = group_id(0)
+    for i in range(n):
+        newcomer = user(USERS + i)
+        yield {"update_id": i, "chat_member": {
+            "chat": chat(chat_id), "from": newcomer, "date": int(time.time()),
+            "old_chat_member": {"status": "left", "user": newcomer},
+            "new_chat_member": {"status": "member", "user": newcomer},
+        }}
+
+
+def warn_storm(n: int, rng: random.Random):
+    chat_id = group_id(1)
+    for i in range(n):
+        target = message(i, chat_id, rng.randrange(1, USERS), "spam")["message"]
+        yield message(i, chat_id, ADMIN_ID, "/warn spamming", reply_to=target)
+
+
+def callbacks(n: int, rng: random.Random):
+    for i in range(n):
+        chat_id, user_id = group_id(rng.randrange(CHATS)), rng.randrange(1, USERS)
+        yield {"update_id": i, "callback_query": {
+            "id": str(i), "from": user(user_id), "chat_instance": str(chat_id),
+            "data": f"verify_{chat_id}_{user_id}",
+            "message": {"message_id": i, "date": int(time.time()), "chat": chat(chat_id), "text": "Verify"},
+        }}
+
+
+SCENARIOS = {
+    "messages": messages,
+    "commands": commands,
+    "join_raid": join_raid,
+    "warn_storm": warn_storm,
+    "callbacks": callbacks,
+}
+
+
+async def run_scenario(dp, bot, name: str, count: int, concurrency: int, seed: int) -> dict:
+    raw = SCENARIOS[name](count, random.Random(seed))
+    updates = [Update.model_validate(update, context={"bot": bot}) for update in raw]
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def feed(update):
+        async with semaphore:
+            start = time.perf_counter()
+            await dp.feed_update(bot, update)
+            latencies.append(time.perf_counter() - start)
+
+    calls = sum(bot.session.calls.values())
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    await asyncio.gather(*(feed(update) for update in updates))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    result = {
+        "scenario": name,
+        "updates": len(updates),
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(len(updates) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "api_calls": sum(bot.session.calls.values()) - calls,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if tracemalloc.is_tracing():
+        result["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    return result
+
+
+async def setup_groups():
+    from database import add_command
+    from utils.word_filter import add_pattern
+
+    for index in range(CHATS):
+        await add_command(group_id(index), "hello", "Hi there!")
+        await add_pattern(group_id(index), "spamword", False)
+
+
+async def run(args) -> list:
+    results = []
+    async with running_dispatcher(args.latency) as (dp, bot):
+        await setup_groups()
+        for name in args.scenario:
+            result = await run_scenario(dp, bot, name, args.updates, args.concurrency, args.seed)
+            results.append(result)
+            print(
+                f"{name:<12} {result['updates']:>7} updates {result['seconds']:>8.2f}s "
+                f"{result['updates_per_second']:>9.1f}/s  p50 {result['p50_ms']:>7.2f}ms  "
+                f"p99 {result['p99_ms']:>7.2f}ms  {result['api_calls']:>7} API calls  "
+                f"peak RSS {result['peak_rss_mb']}MB"
+                + (f", traced {result['peak_traced_mb']}MB" if "peak_traced_mb" in result else "")
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline dispatcher load test")
+    parser.add_argument("--updates", type=int, default=5000, help="updates per scenario")
+    parser.add_argument("--concurrency", type=int, default=100, help="updates processed at once")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated Bot API latency in seconds")
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also report peak Python allocations (slows the run down)")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+    if args.trace_memory:
+        tracemalloc.start()
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Shared setup for the offline tools: the real dispatcher on a mocked Bot.
+
+Import this before anything from the bot itself: settings are read when config
+is imported, and the tools run against a temporary database with metrics and
+update capture switched off.
+"""
+import asyncio
+import logging
+import os
+import tempfile
+from contextlib import asynccontextmanager
+
+_tmp = tempfile.TemporaryDirectory(prefix="bot-tools-")
+os.environ["DB_PATH"] = os.path.join(_tmp.name, "bot.db")
+os.environ["METRICS_PORT"] = "0"
+os.environ["RECORD_UPDATES_DIR"] = ""
+os.environ.setdefault("BOT_TOKEN", "42:OFFLINE")
+# Flush join-raid batches within the run instead of after it
+os.environ.setdefault("JOIN_BATCH_DELAY", "0.5")
+
+from tools.mock_bot import create_mock_bot  # noqa: E402
+
+
+def percentile(values, q: float) -> float:
+    """``q`` quantile of already sorted values."""
+    return values[int(q * (len(values) - 1))] if values else 0.0
+
+
+@asynccontextmanager
+async def running_dispatcher(latency: float = 0.0):
+    """Yield (dispatcher, bot) after the startup hooks ran; shut both down on exit."""
+    from database import init_db
+    from main import create_dispatcher
+
+    logging.getLogger().setLevel(logging.WARNING)
+    await init_db()
+    bot = create_mock_bot(latency)
+    dp = create_dispatcher()
+    await dp.emit_startup(bot=bot, bots=[bot], dispatcher=dp)
+    try:
+        yield dp, bot
+        # Let delayed work (join batches) finish before shutting down
+        await asyncio.sleep(float(os.environ["JOIN_BATCH_DELAY"]) + 0.5)
+    finally:
+        await dp.emit_shutdown(bot=bot, bots=[bot], dispatcher=dp)
+        await bot.session.close()
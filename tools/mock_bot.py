@@ -0,0 +1,79 @@
+import asyncio
+import itertools
+import time
+from collections import Counter
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import (
+    GetMe, GetChatAdministrators, GetChatMember, SendMessage, EditMessageText,
+)
+from aiogram.types import (
+    Chat, ChatMemberAdministrator, ChatMemberMember, ChatMemberOwner, Message, User,
+)
+
+# Owner of every mocked group; the bot itself is an admin with all rights
+ADMIN_ID = 1000
+
+
+class MockSession(BaseSession):
+    """Answers Bot API calls locally after ``latency`` seconds, without any network.
+
+    Calls are counted per API method in ``calls``.
+    """
+
+    def __init__(self, latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[method.__api_method__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._answer(bot, method)
+
+    def _user(self, user_id: int, is_bot: bool = False):
+        return User(id=user_id, is_bot=is_bot, first_name=f"User {user_id}")
+
+    def _answer(self, bot, method):
+        if isinstance(method, GetMe):
+            return User(id=bot.id, is_bot=True, first_name="Bot", username="mock_bot")
+        if isinstance(method, GetChatAdministrators):
+            return [
+                ChatMemberOwner(user=self._user(ADMIN_ID), is_anonymous=False),
+                ChatMemberAdministrator(
+                    user=self._user(bot.id, is_bot=True), can_be_edited=False, is_anonymous=False,
+                    can_manage_chat=True, can_delete_messages=True, can_manage_video_chats=True,
+                    can_restrict_members=True, can_promote_members=True, can_change_info=True,
+                    can_invite_users=True, can_post_stories=True, can_edit_stories=True,
+                    can_delete_stories=True, can_pin_messages=True,
+                ),
+            ]
+        if isinstance(method, GetChatMember):
+            if method.user_id == ADMIN_ID:
+                return ChatMemberOwner(user=self._user(ADMIN_ID), is_anonymous=False)
+            return ChatMemberMember(user=self._user(method.user_id))
+        if isinstance(method, (SendMessage, EditMessageText)) and method.chat_id is not None:
+            return Message(
+                message_id=method.message_id if isinstance(method, EditMessageText) else next(self._message_ids),
+                date=int(time.time()),
+                chat=Chat(id=method.chat_id, type="supergroup"),
+                text=method.text,
+            )
+        # Everything else the bot calls (restrict, ban, delete, answer...) returns True
+        return True
+
+
+def create_mock_bot(latency: float = 0.0) -> Bot:
+    """The bot from main.create_bot on a MockSession, without the outbound limiter."""
+    from main import create_bot
+
+    return create_bot(limiter=False, session=MockSession(latency))
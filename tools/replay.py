@@ -0,0 +1,92 @@
+"""Replay updates captured with RECORD_UPDATES_DIR through the dispatcher.
+
+Feeds the updates of one or more capture files to the real dispatcher on a
+mocked Bot and a temporary database, either with their original timing (scaled
+by --speed) or as fast as possible, then reports throughput and latency.
+Run from the repository root:
+
+    python -m tools.replay captures/updates-0-20260101-120000.ndjson.gz
+    python -m tools.replay captures/*.ndjson.gz --fast --concurrency 200
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import time
+
+from aiogram.types import Update
+
+from tools.harness import percentile, running_dispatcher
+
+
+def load(paths):
+    records = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    # Captures of several workers interleave by arrival time
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+
+async def replay(dp, bot, records, speed: float, fast: bool, concurrency: int) -> list:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def feed(update):
+        async with semaphore:
+            start = time.perf_counter()
+            await dp.feed_update(bot, update)
+            latencies.append(time.perf_counter() - start)
+
+    updates = [Update.model_validate(record["update"], context={"bot": bot}) for record in records]
+    if fast:
+        await asyncio.gather(*(feed(update) for update in updates))
+        return latencies
+    # Original timing: each update is started when it arrived, like polling does
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    first = records[0]["ts"]
+    tasks = []
+    for record, update in zip(records, updates):
+        delay = (record["ts"] - first) / speed - (loop.time() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(feed(update)))
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+async def run(args):
+    records = load(args.files)
+    if not records:
+        print("No updates in the capture.")
+        return
+    span = records[-1]["ts"] - records[0]["ts"]
+    print(f"Replaying {len(records)} updates captured over {span:.1f}s")
+    async with running_dispatcher(args.latency) as (dp, bot):
+        start = time.perf_counter()
+        latencies = await replay(dp, bot, records, args.speed, args.fast, args.concurrency)
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        print(
+            f"{len(latencies)} updates in {elapsed:.2f}s ({len(latencies) / elapsed:.1f}/s), "
+            f"p50 {percentile(latencies, 0.5) * 1000:.2f}ms, p99 {percentile(latencies, 0.99) * 1000:.2f}ms, "
+            f"{sum(bot.session.calls.values())} API calls"
+        )
+        for method, count in bot.session.calls.most_common():
+            print(f"  {method:<28} {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured updates against a mocked bot")
+    parser.add_argument("files", nargs="+", help="capture files (.ndjson.gz)")
+    parser.add_argument("--fast", action="store_true", help="ignore the original timing")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scale for the original timing")
+    parser.add_argument("--concurrency", type=int, default=100, help="updates processed at once with --fast")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated Bot API latency in seconds")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
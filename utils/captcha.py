@@ -0,0 +1,133 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import NamedTuple, Optional
+
+from config import CAPTCHA_SWEEP_BATCH
+from database import (
+    add_pending_verifications, complete_verification, remove_pending_verifications,
+    load_pending_verifications,
+)
+from utils.sharding import owns_chat
+
+logger = logging.getLogger(__name__)
+
+
+class PendingCaptcha(NamedTuple):
+    deadline: int
+    group_id: int
+    user_id: int
+    message_id: Optional[int] = None
+
+
+class CaptchaSweeper:
+    """Kicks users who did not press Verify before their deadline.
+
+    Pending captchas live in a dict keyed by (group_id, user_id), mirrored in
+    the pending_verifications table so they survive restarts, plus a heap
+    ordered by deadline. Verifying pops the dict entry; heap entries that no
+    longer match the dict are skipped when they come up. A single coroutine
+    sleeps until the earliest deadline and kicks expired users in batches.
+    """
+
+    def __init__(self, batch: int = CAPTCHA_SWEEP_BATCH):
+        self.batch = batch
+        self.bot = None
+        self._pending = {}
+        self._heap = []
+        self._wake = asyncio.Event()
+        self._task = None
+
+    async def start(self, bot):
+        if self._task is not None:
+            return
+        self.bot = bot
+        for row in await load_pending_verifications():
+            entry = PendingCaptcha(*row)
+            if owns_chat(entry.group_id):
+                self._track(entry)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _track(self, entry: PendingCaptcha):
+        item = (entry.deadline, entry.group_id, entry.user_id)
+        self._pending[item[1:]] = entry
+        heapq.heappush(self._heap, item)
+        if self._heap[0] is item:
+            self._wake.set()
+
+    async def add(self, group_id: int, user_ids, timeout: int, message_id: int = None):
+        deadline = int(time.time()) + timeout
+        await add_pending_verifications(group_id, user_ids, deadline, message_id)
+        for user_id in user_ids:
+            self._track(PendingCaptcha(deadline, group_id, user_id, message_id))
+
+    def is_pending(self, group_id: int, user_id: int) -> bool:
+        return (group_id, user_id) in self._pending
+
+    async def verify(self, group_id: int, user_id: int) -> bool:
+        """Mark the user verified; returns whether a captcha was pending for them."""
+        pending = self._pending.pop((group_id, user_id), None) is not None
+        await complete_verification(group_id, user_id, int(time.time()))
+        return pending
+
+    async def discard(self, group_id: int, user_id: int):
+        if self._pending.pop((group_id, user_id), None) is not None:
+            await remove_pending_verifications([(group_id, user_id)])
+
+    def _pop_expired(self, now: float):
+        expired = []
+        while self._heap and self._heap[0][0] <= now and len(expired) < self.batch:
+            deadline, *key = heapq.heappop(self._heap)
+            key = tuple(key)
+            entry = self._pending.get(key)
+            # Skip users verified, discarded or re-added with a later deadline since
+            if entry is not None and entry.deadline == deadline:
+                del self._pending[key]
+                expired.append(entry)
+        return expired
+
+    async def _run(self):
+        while True:
+            expired = self._pop_expired(time.time())
+            if expired:
+                await self._kick(expired)
+                continue
+            self._wake.clear()
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _kick(self, expired):
+        await asyncio.gather(*(self._kick_one(entry) for entry in expired))
+        try:
+            await remove_pending_verifications([(entry.group_id, entry.user_id) for entry in expired])
+        except Exception:
+            logger.exception("Failed to clear %s expired captchas", len(expired))
+
+    async def _kick_one(self, entry: PendingCaptcha):
+        try:
+            await self.bot.ban_chat_member(entry.group_id, entry.user_id)
+            await self.bot.unban_chat_member(entry.group_id, entry.user_id)  # kick
+            # Batched captcha messages are shared, only per-user ones are edited
+            if entry.message_id:
+                await self.bot.edit_message_text(
+                    "User kicked for not verifying.", chat_id=entry.group_id, message_id=entry.message_id
+                )
+        except Exception as e:
+            logger.info("Could not kick unverified %s from %s: %s", entry.user_id, entry.group_id, e)
+
+
+captcha = CaptchaSweeper()
@@ -0,0 +1,111 @@
+import json
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import FSM_STORAGE, REDIS_URL, FSM_TTL, FSM_PURGE_INTERVAL, FSM_CACHE_SIZE
+from database import get_fsm, set_fsm_state, set_fsm_data, purge_expired_fsm
+from utils.cache import TTLCache
+from utils.sharding import shard_count
+
+_MISSING = object()
+
+
+def _key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage in the bot database, so prompts survive restarts.
+
+    Each write pushes the key's expiry ``ttl`` seconds ahead; expired entries
+    read as empty and are deleted every ``purge_interval`` seconds on write.
+
+    In supervisor workers reads are served from an in-process cache, keys
+    without state included: every chat is pinned to one worker, so no other
+    process writes the same keys. The cache is not safe across unpinned
+    processes sharing the database, which would serve stale state for up to
+    ``ttl`` seconds, so it is off outside supervisor workers.
+    """
+
+    def __init__(self, ttl: int = FSM_TTL, purge_interval: int = FSM_PURGE_INTERVAL,
+                 cache_size: int = None):
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._purged_at = 0
+        if cache_size is None:
+            cache_size = FSM_CACHE_SIZE if shard_count() > 1 else 0
+        # key -> (state, data as JSON), or _MISSING; expires with the row.
+        # A size of 0 keeps nothing, so every read goes to the database.
+        self._cache = TTLCache(cache_size, ttl)
+
+    async def _load(self, key: str):
+        entry = self._cache.get(key)
+        if entry is None:
+            now = int(time.time())
+            row = await get_fsm(key, now)
+            if row:
+                entry = (row[0], row[1])
+                self._cache.set(key, entry, row[2] - now)
+            else:
+                entry = _MISSING
+                self._cache.set(key, entry)
+        return None if entry is _MISSING else entry
+
+    async def _purge(self, now: int):
+        if now - self._purged_at >= self.purge_interval:
+            self._purged_at = now
+            await purge_expired_fsm(now)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        if isinstance(state, State):
+            state = state.state
+        now = int(time.time())
+        k = _key(key)
+        cached = self._cache.get(k)
+        await set_fsm_state(k, state, now, now + self.ttl)
+        if cached is None:
+            # The database keeps the unexpired data we do not know
+            self._cache.pop(k)
+        else:
+            self._cache.set(k, (state, "{}" if cached is _MISSING else cached[1]))
+        await self._purge(now)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        entry = await self._load(_key(key))
+        return entry[0] if entry else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        now = int(time.time())
+        k = _key(key)
+        cached = self._cache.get(k)
+        payload = json.dumps(data)
+        await set_fsm_data(k, payload, now, now + self.ttl)
+        if cached is None:
+            self._cache.pop(k)
+        else:
+            self._cache.set(k, (None if cached is _MISSING else cached[0], payload))
+        await self._purge(now)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        entry = await self._load(_key(key))
+        return json.loads(entry[1]) if entry else {}
+
+    async def close(self) -> None:
+        # The connections belong to the database pool, closed by close_db
+        pass
+
+
+def create_storage() -> BaseStorage:
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    if FSM_STORAGE == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as e:
+            raise RuntimeError("FSM_STORAGE=redis requires the redis package (pip install redis)") from e
+        return RedisStorage.from_url(REDIS_URL, state_ttl=FSM_TTL, data_ttl=FSM_TTL)
+    return SQLiteStorage()
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from config import JOIN_BURST_THRESHOLD, JOIN_BURST_WINDOW, JOIN_BATCH_DELAY, JOIN_BATCH_MAX
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class JoinCoalescer:
+    """Detects join bursts per chat and batches the newcomers of a burst.
+
+    ``is_burst`` records a join and reports whether the chat has seen more
+    than ``threshold`` joins in the last ``window`` seconds. During a burst,
+    ``add`` collects users per key and calls ``flush(users)`` once, ``delay``
+    seconds after the first of them (or sooner when ``max_size`` is reached).
+    """
+
+    def __init__(self, threshold: int = JOIN_BURST_THRESHOLD, window: float = JOIN_BURST_WINDOW,
+                 delay: float = JOIN_BATCH_DELAY, max_size: int = JOIN_BATCH_MAX):
+        self.threshold = threshold
+        self.window = window
+        self.delay = delay
+        self.max_size = max_size
+        self._joins = TTLCache(10000, window)
+        self._batches = {}
+
+    def is_burst(self, chat_id: int) -> bool:
+        now = time.monotonic()
+        joins = self._joins.get(chat_id)
+        if joins is None:
+            joins = deque(maxlen=self.threshold + 1)
+        joins.append(now)
+        self._joins.set(chat_id, joins)
+        return len(joins) > self.threshold and now - joins[0] <= self.window
+
+    def add(self, key, user, flush):
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = []
+            asyncio.create_task(self._flush_later(key, batch, flush))
+        batch.append(user)
+        if len(batch) >= self.max_size:
+            del self._batches[key]
+            asyncio.create_task(self._flush(batch, flush))
+
+    async def _flush_later(self, key, batch, flush):
+        await asyncio.sleep(self.delay)
+        # Already flushed early if the batch filled up
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+            await self._flush(batch, flush)
+
+    async def _flush(self, batch, flush):
+        try:
+            await flush(batch)
+        except Exception:
+            logger.exception("Failed to flush a batch of %s joins", len(batch))
@@ -1,20 +1,112 @@
+import asyncio
+import html
 import logging
-from config import LOG_CHANNEL_ID
+from config import LOG_CHANNEL_ID, LOG_QUEUE_SIZE, LOG_FLUSH_INTERVAL
+from utils.rate_limiter import outbound_priority, Priority
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Telegram's limit for one message
+DIGEST_LIMIT = 4096
+
+
+class ActionLog:
+    """Posts moderation actions to LOG_CHANNEL_ID as digest messages.
+
+    Entries are queued and packed into messages of at most DIGEST_LIMIT
+    characters, sent every ``interval`` seconds or as soon as one is full.
+    When the queue is full new entries are dropped and counted, and the count
+    is reported in the next digest.
+    """
+
+    def __init__(self, channel_id=LOG_CHANNEL_ID, maxsize: int = LOG_QUEUE_SIZE,
+                 interval: float = LOG_FLUSH_INTERVAL):
+        self.channel_id = channel_id
+        self.interval = interval
+        self.bot = None
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize)
+        self._batch = []
+        self._task = None
+
+    async def start(self, bot):
+        if self._task is not None or not self.channel_id:
+            return
+        self.bot = bot
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while not self._queue.empty():
+            self._batch.append(self._queue.get_nowait())
+        if self._batch or self.dropped:
+            await self._send()
+
+    def add(self, entry: str):
+        if self._task is None:
+            return
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch.append(await self._queue.get())
+            size = len(self._batch[0])
+            deadline = loop.time() + self.interval
+            while size < DIGEST_LIMIT:
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+                self._batch.append(entry)
+                size += len(entry) + 2
+            await self._send()
+
+    def _digests(self, entries):
+        digest = ""
+        for entry in entries:
+            entry = entry[:DIGEST_LIMIT]
+            if digest and len(digest) + 2 + len(entry) > DIGEST_LIMIT:
+                yield digest
+                digest = ""
+            digest = f"{digest}\n\n{entry}" if digest else entry
+        if digest:
+            yield digest
+
+    async def _send(self):
+        entries, self._batch = self._batch, []
+        if self.dropped:
+            entries.append(f"⚠️ {self.dropped} log entries dropped, the log queue was full.")
+            self.dropped = 0
+        with outbound_priority(Priority.COSMETIC):
+            for digest in self._digests(entries):
+                try:
+                    await self.bot.send_message(self.channel_id, digest)
+                except Exception as e:
+                    logger.warning("Failed to send log digest to %s: %s", self.channel_id, e)
+
+
+action_log = ActionLog()
+
+
 async def log_action(chat_id, action, target_user, admin_user, reason="", duration=0):
-    log_text = f"**#{action.upper()}**\n"
-    log_text += f"User: {target_user.full_name} (`{target_user.id}`)\n"
-    log_text += f"Admin: {admin_user.full_name} (`{admin_user.id}`)\n"
-    log_text += f"Chat: `{chat_id}`\n"
-    log_text += f"Reason: {reason}\n"
+    log_text = f"<b>#{action.upper()}</b>\n"
+    log_text += f"User: {html.escape(target_user.full_name)} (<code>{target_user.id}</code>)\n"
+    log_text += f"Admin: {html.escape(admin_user.full_name)} (<code>{admin_user.id}</code>)\n"
+    log_text += f"Chat: <code>{chat_id}</code>\n"
+    log_text += f"Reason: {html.escape(reason)}"
     if duration:
-        log_text += f"Duration: {duration} seconds\n"
+        log_text += f"\nDuration: {duration} seconds"
     logger.info(log_text)
-    if LOG_CHANNEL_ID:
-        try:
-            await bot.send_message(LOG_CHANNEL_ID, log_text)
-        except:
-            pass
+    action_log.add(log_text)
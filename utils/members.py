@@ -0,0 +1,135 @@
+import asyncio
+from typing import NamedTuple
+
+from config import (
+    MEMBER_CACHE_SIZE, MEMBER_CACHE_TTL, ADMIN_CACHE_SIZE, ADMIN_CACHE_TTL, BOT_RIGHTS_TTL,
+)
+from utils.cache import TTLCache
+
+ADMIN_STATUSES = ("administrator", "creator")
+
+# (chat_id, user_id) -> ChatMember
+_members = TTLCache(MEMBER_CACHE_SIZE, MEMBER_CACHE_TTL)
+# chat_id -> {user_id: ChatMember} for every admin of the chat
+_admins = TTLCache(ADMIN_CACHE_SIZE, ADMIN_CACHE_TTL)
+# chat_id -> BotRights of this bot, refreshed by my_chat_member updates
+_bot_rights = TTLCache(ADMIN_CACHE_SIZE, BOT_RIGHTS_TTL)
+# Lookups currently waiting on Telegram, shared by concurrent callers
+_inflight = {}
+# The bot's own User, resolved once at startup
+_bot_user = None
+
+
+class BotRights(NamedTuple):
+    is_admin: bool = False
+    can_restrict_members: bool = False
+    can_delete_messages: bool = False
+    can_pin_messages: bool = False
+
+    @classmethod
+    def from_member(cls, member):
+        if member.status == "creator":
+            return cls(True, True, True, True)
+        if member.status != "administrator":
+            return cls()
+        return cls(
+            True,
+            bool(member.can_restrict_members),
+            bool(member.can_delete_messages),
+            bool(member.can_pin_messages),
+        )
+
+
+async def _single_flight(key, fetch):
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # Shield so one cancelled caller does not cancel the lookup for the others
+    return await asyncio.shield(task)
+
+
+async def _fetch_admins(bot, chat_id: int):
+    members = await bot.get_chat_administrators(chat_id)
+    admins = {member.user.id: member for member in members}
+    _admins.set(chat_id, admins)
+    # The list tells us our own rights too: not in it means not an admin
+    bot_member = admins.get(bot.id)
+    _bot_rights.set(chat_id, BotRights.from_member(bot_member) if bot_member else BotRights())
+    for member in members:
+        _members.set((chat_id, member.user.id), member)
+    return admins
+
+
+async def _fetch_member(bot, chat_id: int, user_id: int):
+    member = await bot.get_chat_member(chat_id, user_id)
+    _members.set((chat_id, user_id), member)
+    return member
+
+
+async def get_chat_admins(bot, chat_id: int) -> dict:
+    admins = _admins.get(chat_id)
+    if admins is None:
+        admins = await _single_flight(("admins", chat_id), lambda: _fetch_admins(bot, chat_id))
+    return admins
+
+
+async def get_member(bot, chat_id: int, user_id: int):
+    member = _members.get((chat_id, user_id))
+    if member is None:
+        admins = _admins.get(chat_id)
+        if admins is not None and user_id in admins:
+            return admins[user_id]
+        member = await _single_flight(
+            ("member", chat_id, user_id), lambda: _fetch_member(bot, chat_id, user_id)
+        )
+    return member
+
+
+async def is_chat_admin(bot, chat_id: int, user_id: int) -> bool:
+    # The admin list is complete, so anybody missing from it is not an admin
+    return user_id in await get_chat_admins(bot, chat_id)
+
+
+def update_member(chat_id: int, member):
+    """Apply a membership change reported by a chat_member/my_chat_member update."""
+    _members.set((chat_id, member.user.id), member)
+    admins = _admins.get(chat_id)
+    if admins is None:
+        return
+    if member.status in ADMIN_STATUSES:
+        admins[member.user.id] = member
+    else:
+        admins.pop(member.user.id, None)
+
+
+def update_bot_rights(chat_id: int, member):
+    update_member(chat_id, member)
+    _bot_rights.set(chat_id, BotRights.from_member(member))
+    if member.status in ("left", "kicked"):
+        _admins.pop(chat_id)
+
+
+async def _fetch_bot_rights(bot, chat_id: int):
+    member = await _fetch_member(bot, chat_id, bot.id)
+    rights = BotRights.from_member(member)
+    _bot_rights.set(chat_id, rights)
+    return rights
+
+
+async def get_bot_rights(bot, chat_id: int) -> BotRights:
+    rights = _bot_rights.get(chat_id)
+    if rights is None:
+        rights = await _single_flight(("rights", chat_id), lambda: _fetch_bot_rights(bot, chat_id))
+    return rights
+
+
+async def load_bot_user(bot):
+    global _bot_user
+    _bot_user = await bot.me()
+    return _bot_user
+
+
+def get_bot_user():
+    return _bot_user
@@ -1,15 +1,18 @@
 from aiogram.types import Message
 from config import OWNER_ID
+from utils.members import is_chat_admin, get_chat_admins, get_bot_rights
 
-async def check_bot_admin(message: Message, bot):
-    bot_member = await message.chat.get_member(bot.id)
-    return bot_member.status in ["administrator", "creator"]
+async def check_bot_admin(message: Message, bot, right: str = None):
+    # Answered from the cached rights, so a missing right costs no API call
+    rights = await get_bot_rights(bot, message.chat.id)
+    if not rights.is_admin:
+        return False
+    return right is None or getattr(rights, right)
 
 async def is_admin(message: Message):
     if message.from_user.id == OWNER_ID:
         return True
-    member = await message.chat.get_member(message.from_user.id)
-    return member.status in ["administrator", "creator"]
+    return await is_chat_admin(message.bot, message.chat.id, message.from_user.id)
 
 async def can_act_on_user(message: Message, target_user):
     # Cannot act on self
@@ -21,8 +24,9 @@ async def can_act_on_user(message: Message, target_user):
         await message.reply("You cannot act on a bot.")
         return False
     # Check target admin status
-    target_member = await message.chat.get_member(target_user.id)
-    if target_member.status in ["administrator", "creator"]:
+    admins = await get_chat_admins(message.bot, message.chat.id)
+    target_member = admins.get(target_user.id)
+    if target_member is not None:
         # If target is admin, check if current user is owner or higher
         if message.from_user.id == OWNER_ID:
             return True
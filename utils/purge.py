@@ -0,0 +1,59 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest
+
+from config import PURGE_CHUNK_SIZE, PURGE_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+
+async def purge_messages(bot, chat_id: int, start_id: int, end_id: int, progress=None) -> int:
+    """Delete messages ``start_id``..``end_id`` with deleteMessages, 100 ids per call.
+
+    Chunks run ``PURGE_CONCURRENCY`` at a time; pacing and flood-wait retries
+    are left to the outbound limiter on the bot session. ``progress(done,
+    total)`` is awaited after each chunk. Returns the number of ids covered by
+    successful calls. That is not a deletion count: Telegram silently skips
+    ids that no longer exist and does not say how many it removed.
+    """
+    ids = list(range(start_id, end_id + 1))
+    chunks = [ids[i:i + PURGE_CHUNK_SIZE] for i in range(0, len(ids), PURGE_CHUNK_SIZE)]
+    semaphore = asyncio.Semaphore(PURGE_CONCURRENCY)
+    processed = 0
+    done = 0
+
+    async def delete_chunk(chunk):
+        nonlocal processed, done
+        async with semaphore:
+            try:
+                await bot.delete_messages(chat_id, chunk)
+                processed += len(chunk)
+            except TelegramBadRequest as e:
+                # e.g. every message in the chunk is older than 48 hours
+                logger.info("Purge chunk in %s failed: %s", chat_id, e.message)
+            done += len(chunk)
+            if progress:
+                await progress(done, len(ids))
+
+    await asyncio.gather(*(delete_chunk(chunk) for chunk in chunks))
+    return processed
+
+
+def throttled(callback, interval: float = 2.0):
+    """Wrap a progress callback so it fires at most every ``interval`` seconds."""
+    last = 0.0
+
+    async def wrapper(done, total):
+        nonlocal last
+        now = time.monotonic()
+        if done < total and now - last < interval:
+            return
+        last = now
+        try:
+            await callback(done, total)
+        except Exception:
+            pass
+
+    return wrapper
@@ -0,0 +1,190 @@
+import asyncio
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import (
+    OUTBOUND_RATE, OUTBOUND_GROUP_RATE, OUTBOUND_PRIVATE_RATE, OUTBOUND_MAX_RETRIES,
+)
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, bursts up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def peek(self) -> float:
+        """Seconds until a token is available, without taking it."""
+        self._refill()
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take ``tokens`` now and return how long the caller must wait before using them."""
+        self._refill()
+        self._tokens -= tokens
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self, tokens: float = 1):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Hand out nothing for ``seconds`` (e.g. after a 429)."""
+        self._refill()
+        self._tokens = min(self._tokens, 1 - seconds * self.rate)
+
+
+class Priority(IntEnum):
+    MODERATION = 0
+    NORMAL = 1
+    COSMETIC = 2
+
+
+MODERATION_METHODS = frozenset({
+    "banChatMember", "unbanChatMember", "restrictChatMember", "banChatSenderChat",
+    "deleteMessage", "deleteMessages", "declineChatJoinRequest",
+})
+# Methods counted against Telegram's per-chat message limits
+SEND_METHOD_PREFIXES = ("send", "forward", "copy")
+
+_priority = ContextVar("outbound_priority", default=None)
+
+
+@contextmanager
+def outbound_priority(priority: Priority):
+    """Send every Bot API call made inside the block at ``priority``."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """Session middleware that schedules every outgoing Bot API call.
+
+    Calls wait for a token from one global bucket (OUTBOUND_RATE/s) and, for
+    message sends, from a bucket for the target chat (OUTBOUND_GROUP_RATE/s for
+    groups, OUTBOUND_PRIVATE_RATE/s for private chats). Waiting calls are
+    granted by priority, so moderation actions overtake queued welcomes. A 429
+    pauses the affected bucket for retry_after and the call is retried.
+    Read-only get* calls bypass the queue.
+    """
+
+    def __init__(self, rate: float = OUTBOUND_RATE, group_rate: float = OUTBOUND_GROUP_RATE,
+                 private_rate: float = OUTBOUND_PRIVATE_RATE, max_retries: int = OUTBOUND_MAX_RETRIES):
+        self.group_rate = group_rate
+        self.private_rate = private_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(rate)
+        self._chats = TTLCache(100000, 3600)
+        self._waiters = []
+        self._sorted = True
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._pump_task = None
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        if name.startswith("get"):
+            return await make_request(bot, method)
+        priority = _priority.get()
+        if priority is None:
+            priority = Priority.MODERATION if name in MODERATION_METHODS else Priority.NORMAL
+        chat_id = getattr(method, "chat_id", None)
+        chat_bucket = self._chat_bucket(chat_id) if name.startswith(SEND_METHOD_PREFIXES) else None
+        attempt = 0
+        while True:
+            await self._acquire(priority, chat_bucket)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning("Flood control on %s (chat %s), retrying in %ss", name, chat_id, e.retry_after)
+                (chat_bucket or self._global).pause(e.retry_after)
+                self._wake.set()
+
+    def _chat_bucket(self, chat_id):
+        if not isinstance(chat_id, int):
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_rate * 60)
+            else:
+                bucket = TokenBucket(self.private_rate)
+            self._chats.set(chat_id, bucket)
+        return bucket
+
+    async def _acquire(self, priority, chat_bucket):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((priority, next(self._seq), chat_bucket, future))
+        self._sorted = False
+        self._wake.set()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self):
+        while True:
+            if not self._waiters:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            if not self._sorted:
+                self._waiters.sort(key=lambda waiter: waiter[:2])
+                self._sorted = True
+            delay = self._global.peek()
+            if delay == 0:
+                delay = self._grant_next()
+            if delay == 0:
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=None if delay == float("inf") else delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _grant_next(self) -> float:
+        """Grant the best waiter whose chat has capacity; else return the shortest wait."""
+        blocked = set()
+        shortest = float("inf")
+        for index, (_, _, chat_bucket, future) in enumerate(self._waiters):
+            if future.done():
+                del self._waiters[index]
+                return 0.0
+            if chat_bucket is not None:
+                if id(chat_bucket) in blocked:
+                    continue
+                wait = chat_bucket.peek()
+                if wait > 0:
+                    blocked.add(id(chat_bucket))
+                    shortest = min(shortest, wait)
+                    continue
+                chat_bucket.reserve()
+            self._global.reserve()
+            del self._waiters[index]
+            future.set_result(None)
+            return 0.0
+        return shortest
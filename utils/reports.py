@@ -0,0 +1,45 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+
+from config import REPORT_CONCURRENCY, REPORT_RETRY_AFTER
+from database import get_unreachable_admins, record_report_results
+from utils.members import get_chat_admins
+
+logger = logging.getLogger(__name__)
+
+
+async def send_report(bot, chat_id: int, text: str) -> int:
+    """DM ``text`` to every human admin of the chat; returns how many received it.
+
+    Admins the bot cannot DM (blocked the bot, never started it) are
+    remembered and skipped for REPORT_RETRY_AFTER seconds. Other errors are
+    logged only, so a bad message cannot mark every admin unreachable.
+    """
+    admins = await get_chat_admins(bot, chat_id)
+    recipients = [user_id for user_id, member in admins.items() if not member.user.is_bot]
+    now = int(time.time())
+    skipped = await get_unreachable_admins(recipients, now - REPORT_RETRY_AFTER)
+    semaphore = asyncio.Semaphore(REPORT_CONCURRENCY)
+    delivered, failed = [], []
+
+    async def deliver(user_id):
+        async with semaphore:
+            try:
+                await bot.send_message(user_id, text)
+                delivered.append(user_id)
+            except TelegramForbiddenError:
+                failed.append(user_id)
+            except TelegramBadRequest as e:
+                if "chat not found" in e.message.lower():
+                    failed.append(user_id)
+                else:
+                    logger.warning("Failed to deliver report to %s: %s", user_id, e.message)
+            except Exception:
+                logger.exception("Failed to deliver report to %s", user_id)
+
+    await asyncio.gather(*(deliver(user_id) for user_id in recipients if user_id not in skipped))
+    await record_report_results(delivered, failed, now)
+    return len(delivered)
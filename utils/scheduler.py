@@ -0,0 +1,135 @@
+import asyncio
+import heapq
+import logging
+import math
+import time
+
+from config import SCHEDULER_HORIZON, SCHEDULER_BATCH
+from database import add_job, get_jobs, claim_jobs, recover_mute_jobs, on_job_added
+from utils.sharding import owns_chat
+
+logger = logging.getLogger(__name__)
+
+# kind -> coroutine function(bot, job)
+_handlers = {}
+
+
+def job_handler(kind: str):
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+async def schedule(kind: str, run_at: int, group_id: int, user_id: int, payload=None):
+    return await add_job(math.ceil(run_at), kind, group_id, user_id, payload)
+
+
+class Scheduler:
+    """Runs jobs from the ``jobs`` table when they are due.
+
+    Jobs stay in SQLite; only those due within ``horizon`` seconds are kept in
+    an in-memory heap, which is refilled from the run_at index as time moves
+    on. A single loop sleeps until the earliest queued job.
+    """
+
+    def __init__(self, horizon: int = SCHEDULER_HORIZON, batch: int = SCHEDULER_BATCH):
+        self.horizon = horizon
+        self.batch = batch
+        self.bot = None
+        self._heap = []
+        self._queued = set()
+        self._loaded_until = 0
+        self._wake = asyncio.Event()
+        self._task = None
+        on_job_added(self._push)
+
+    async def start(self, bot):
+        if self._task is not None:
+            return
+        self.bot = bot
+        await recover_mute_jobs()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _push(self, job):
+        # Jobs beyond the loaded window are picked up by a later refill,
+        # jobs of chats in another worker's shard are run by that worker
+        if job.run_at > self._loaded_until or job.id in self._queued or not owns_chat(job.group_id):
+            return
+        heapq.heappush(self._heap, job)
+        self._queued.add(job.id)
+        if self._heap[0] is job:
+            self._wake.set()
+
+    async def _refill(self, now: float):
+        after = self._loaded_until
+        until = int(now) + self.horizon
+        # Raised early so jobs added while the query runs are pushed too;
+        # restored on failure so the next refill covers the same window
+        self._loaded_until = until
+        try:
+            jobs = await get_jobs(after, until)
+        except Exception:
+            self._loaded_until = after
+            raise
+        for job in jobs:
+            self._push(job)
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            if now + self.horizon / 2 >= self._loaded_until:
+                try:
+                    await self._refill(now)
+                except Exception:
+                    logger.exception("Failed to load scheduled jobs")
+            due = []
+            while self._heap and self._heap[0].run_at <= now and len(due) < self.batch:
+                job = heapq.heappop(self._heap)
+                self._queued.discard(job.id)
+                due.append(job)
+            if due:
+                await self._execute(due)
+                continue
+            wake_at = self._loaded_until - self.horizon / 2
+            if self._heap:
+                wake_at = min(wake_at, self._heap[0].run_at)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(0.0, wake_at - time.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, due):
+        try:
+            claimed = await claim_jobs([job.id for job in due])
+        except Exception:
+            logger.exception("Failed to claim scheduled jobs")
+            for job in due:
+                self._push(job)
+            await asyncio.sleep(1)
+            return
+        await asyncio.gather(*(self._run_job(job) for job in due if job.id in claimed))
+
+    async def _run_job(self, job):
+        handler = _handlers.get(job.kind)
+        if handler is None:
+            logger.warning("No handler for scheduled job %s", job.kind)
+            return
+        try:
+            await handler(self.bot, job)
+        except Exception:
+            logger.exception("Scheduled %s job for %s in %s failed", job.kind, job.user_id, job.group_id)
+
+
+scheduler = Scheduler()
@@ -0,0 +1,43 @@
+# Set in worker processes of the supervisor; None means this process
+# handles every chat.
+_shard = None
+
+
+def shard_of(chat_id: int, count: int) -> int:
+    return abs(chat_id) % count
+
+
+def set_shard(index: int, count: int):
+    global _shard
+    _shard = (index, count)
+
+
+def shard_index() -> int:
+    return _shard[0] if _shard else 0
+
+
+def shard_count() -> int:
+    return _shard[1] if _shard else 1
+
+
+def owns_chat(chat_id: int) -> bool:
+    return _shard is None or shard_of(chat_id, _shard[1]) == _shard[0]
+
+
+def update_chat_id(update: dict) -> int:
+    """Chat an update belongs to, read from the raw update without parsing it.
+
+    Updates without a chat (inline queries, poll answers) use the user id.
+    """
+    for key, value in update.items():
+        if not isinstance(value, dict):
+            continue
+        if "chat" in value:
+            return value["chat"]["id"]
+        message = value.get("message")
+        if message and "chat" in message:
+            return message["chat"]["id"]
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+    return 0
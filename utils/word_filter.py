@@ -0,0 +1,121 @@
+import logging
+import re
+
+from config import FILTER_CACHE_SIZE, FILTER_CACHE_TTL
+from database import add_filter, remove_filter, list_filters
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# group_id -> tuple of compiled patterns, or _EMPTY when the group has no filters.
+# There is one pattern unless the group has legacy rows failing check_regex.
+_matchers = TTLCache(FILTER_CACHE_SIZE, FILTER_CACHE_TTL)
+_EMPTY = object()
+_DEFAULT_FLAGS = re.compile("").flags
+# \1..\99 and (?(1)...) refer to groups by number, which joining shifts
+_BACKREF = re.compile(r"(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?\()")
+
+
+def _trie_regex(words) -> str:
+    """Build a regex that matches any of ``words`` by walking a prefix trie.
+
+    Shared prefixes are factored out, so the regex engine never retries the
+    same characters for every word and matching cost does not grow with the
+    number of words.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node) -> str:
+        optional = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")" + ("?" if optional else "")
+
+    return build(trie)
+
+
+def check_regex(pattern: str):
+    """Raise ``re.error`` unless ``pattern`` can share one alternation with others.
+
+    Inline global flags, named groups and backreferences change meaning or
+    clash once several filters are joined, so they are rejected.
+    """
+    compiled = re.compile(pattern)
+    if compiled.flags != _DEFAULT_FLAGS:
+        raise re.error("inline global flags are not supported, use (?i:...) instead")
+    if compiled.groupindex:
+        raise re.error("named groups are not supported")
+    if _BACKREF.search(pattern):
+        raise re.error("backreferences are not supported")
+
+
+def compile_filters(entries):
+    """Compile a group's filters into case-insensitive patterns.
+
+    Plain words go into a trie and valid regexes are joined next to it, so a
+    message is searched once whatever the number of filters. Rows stored
+    before check_regex existed are compiled on their own instead.
+    """
+    words = {pattern.lower() for pattern, is_regex in entries if not is_regex}
+    parts, legacy = [], []
+    if words:
+        parts.append(r"(?<!\w)" + _trie_regex(words) + r"(?!\w)")
+    for pattern, is_regex in entries:
+        if not is_regex:
+            continue
+        try:
+            check_regex(pattern)
+            parts.append(f"(?:{pattern})")
+        except re.error:
+            legacy.append(pattern)
+    patterns = [re.compile("|".join(parts), re.IGNORECASE)] if parts else []
+    for pattern in legacy:
+        try:
+            patterns.append(re.compile(pattern, re.IGNORECASE))
+        except re.error as e:
+            # Must not block the rest of the group's filters
+            logger.warning("Skipping invalid filter regex %r: %s", pattern, e)
+    return tuple(patterns) or None
+
+
+async def get_matcher(group_id: int):
+    matcher = _matchers.get(group_id)
+    if matcher is None:
+        matcher = compile_filters(await list_filters(group_id)) or _EMPTY
+        _matchers.set(group_id, matcher)
+    return None if matcher is _EMPTY else matcher
+
+
+async def find_blocked(group_id: int, *texts):
+    """Return the first blocked fragment found in ``texts``, if any."""
+    patterns = await get_matcher(group_id)
+    if patterns is None:
+        return None
+    for text in texts:
+        if text:
+            for pattern in patterns:
+                match = pattern.search(text)
+                if match:
+                    return match.group(0)
+    return None
+
+
+async def add_pattern(group_id: int, pattern: str, is_regex: bool = False):
+    if is_regex:
+        check_regex(pattern)  # raises re.error for the caller to report
+    await add_filter(group_id, pattern, is_regex)
+    _matchers.pop(group_id)
+
+
+async def remove_pattern(group_id: int, pattern: str) -> bool:
+    removed = await remove_filter(group_id, pattern)
+    _matchers.pop(group_id)
+    return removed